@@ -1,281 +1,206 @@
-from http.server import BaseHTTPRequestHandler
-import json
 import os
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 
 sys.path.append(os.path.dirname(__file__))
 
 try:
     from supabase_client import supabase
-    from health import log_error
+    from http_cache import send_json_with_etag
+    import shop_stats
+    import settings_cache
+    from order_summary import OrderSummary, MOSCOW_TZ
+    from products import apply_sort_order
+    from admin_roles import get_admin, invalidate_admin_cache
+    from routing import JsonHandler, HttpError
 except ImportError as e:
     print(f"Import error: {e}")
 
-class Handler(BaseHTTPRequestHandler):
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+class Handler(JsonHandler):
+    log_name = 'admin'
+    routes = [
+        ('GET', '/api/admin', 'get_admin_status'),
+        ('GET', '/api/admin/categories', 'get_categories'),
+        ('GET', '/api/admin/admins', 'get_admins'),
+        ('GET', '/api/admin/stats', 'get_stats'),
+        ('GET', '/api/admin/themes', 'get_themes'),
+        ('GET', '/api/admin/settings', 'get_settings'),
+        ('GET', '/api/admin/confirmation-codes', 'get_confirmation_codes'),
+        ('POST', '/api/admin', 'create_resource'),
+        ('POST', '/api/admin/settings', 'save_settings'),
+        ('POST', '/api/admin/stats/rebuild', 'rebuild_stats'),
+        ('PUT', '/api/admin', 'set_active_theme'),
+        ('PUT', '/api/admin/categories/reorder', 'reorder_categories'),
+        ('PUT', '/api/admin/category/{category_id:int}', 'update_category'),
+        ('DELETE', '/api/admin/{admin_id:int}', 'delete_admin'),
+        ('DELETE', '/api/admin/category/{category_id:int}', 'delete_category'),
+        ('DELETE', '/api/admin/order/{order_id:int}', 'delete_order'),
+    ]
     
-    def do_GET(self):
-        try:
-            path = self.path
-            telegram_id = self.headers.get('Telegram-Id', '').strip()
-            
-            if '/categories' in path:
-                response = supabase.table("categories").select("*").order("sort_order").execute()
-                data = response.data
-            elif '/admins' in path:
-                response = supabase.table("admins").select("*").execute()
-                data = response.data
-            elif '/stats' in path:
-                orders_response = supabase.table("orders").select("*").execute()
-                products_response = supabase.table("products").select("*").execute()
-                promocodes_response = supabase.table("promocodes").select("*").execute()
-                
-                total_orders = len(orders_response.data)
-                completed_orders = len([o for o in orders_response.data if o.get('status_id') == 5])
-                total_revenue = sum(order.get('profit', 0) for order in orders_response.data if order.get('status_id') == 5)
-                potential_revenue = sum(order['total_amount'] for order in orders_response.data if order.get('status_id') != 5)
-                total_products = len(products_response.data)
-                active_promocodes = len([p for p in promocodes_response.data if p.get('is_active')])
-                
-                data = {
-                    'total_orders': total_orders,
-                    'completed_orders': completed_orders,
-                    'total_revenue': total_revenue,
-                    'potential_revenue': potential_revenue,
-                    'total_products': total_products,
-                    'active_promocodes': active_promocodes
-                }
-            elif '/themes' in path:
-                response = supabase.table("shop_themes").select("*").execute()
-                data = response.data
-            elif '/settings' in path:
-                response = supabase.table("shop_settings").select("*").execute()
-                data = {item['key']: item['value'] for item in response.data}
-            elif '/confirmation-codes' in path:
-                response = supabase.table("confirmation_codes").select("*").execute()
-                data = response.data
-            else:
-                response = supabase.table("admins").select("role,is_active,first_name,username").eq("telegram_id", telegram_id).eq("is_active", True).execute()
-                is_admin = len(response.data) > 0
-                
-                if is_admin:
-                    admin_data = response.data[0]
-                    data = {
-                        'is_admin': True,
-                        'is_active': admin_data.get('is_active', True),
-                        'role': admin_data.get('role', 'manager'),
-                        'first_name': admin_data.get('first_name', ''),
-                        'username': admin_data.get('username', '')
-                    }
-                else:
-                    data = {'is_admin': False}
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            self.wfile.write(json.dumps(data).encode('utf-8'))
-            
-        except Exception as e:
-            log_error("admin_GET", e, self.headers.get('Telegram-Id', ''), f"Path: {path}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+    def get_admin_status(self):
+        # Без сессии — 401, чтобы клиент обновил ее, а не решил, что прав нет
+        admin_data = get_admin(self.require_session()['sub'])
+        if not admin_data:
+            return {'is_admin': False}
+        return {
+            'is_admin': True,
+            'is_active': admin_data.get('is_active', True),
+            'role': admin_data.get('role', 'manager'),
+            'first_name': admin_data.get('first_name', ''),
+            'username': admin_data.get('username', '')
+        }
     
-    def do_POST(self):
-        try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data)
-            
-            if 'telegram_id' in data:
-                admin_data = data
-                if 'is_active' not in admin_data:
-                    admin_data['is_active'] = True
-                    
-                response = supabase.table("admins").insert(admin_data).execute()
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                response_data = {'success': True, 'admin': response.data[0] if response.data else None}
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-            elif 'name' in data and 'slug' in data:
-                category_data = {
-                    'name': data['name'],
-                    'slug': data['slug'],
-                    'icon': data.get('icon', 'fas fa-folder'),
-                    'sort_order': data.get('sort_order', 0),
-                    'is_active': data.get('is_active', True)
-                }
-                
-                max_order_response = supabase.table("categories").select("sort_order").order("sort_order", desc=True).limit(1).execute()
-                max_order = max_order_response.data[0]['sort_order'] if max_order_response.data else 0
-                category_data['sort_order'] = max_order + 1
-                
-                response = supabase.table("categories").insert(category_data).execute()
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                response_data = {'success': True, 'category': response.data[0] if response.data else None}
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-            else:
-                key = data.get('key')
-                value = data.get('value')
-                
-                if key and value is not None:
-                    existing = supabase.table("shop_settings").select("*").eq("key", key).execute()
-                    
-                    if existing.data:
-                        response = supabase.table("shop_settings").update({"value": value}).eq("key", key).execute()
-                    else:
-                        response = supabase.table("shop_settings").insert({"key": key, "value": value}).execute()
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    
-                    response_data = {'success': True}
-                    self.wfile.write(json.dumps(response_data).encode('utf-8'))
-                else:
-                    self.send_response(400)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    response = {'success': False, 'error': 'Missing key or value'}
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
-            
-        except Exception as e:
-            log_error("admin_POST", e, self.headers.get('Telegram-Id', ''), f"Data: {data}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+    def get_categories(self):
+        response = supabase.table("categories").select("*").order("sort_order").execute()
+        send_json_with_etag(self, response.data)
+    
+    def get_admins(self):
+        self.require_role()
+        return supabase.table("admins").select("*").execute().data
+    
+    def get_stats(self):
+        # Статистику читают администраторы и серверные вызовы с CRON_SECRET (/stats в боте, health)
+        if not self.is_cron_request():
+            self.require_role()
+        data = self.get_shop_stats()
+        days = self.query_param('days')
+        if days.isdigit():
+            data['daily'] = shop_stats.read_daily(min(int(days), 366))
+        if self.query_param('breakdown') == '1':
+            data['breakdown'] = self.get_orders_breakdown(min(int(days), 366) if days.isdigit() else 30)
+        return data
+    
+    def get_themes(self):
+        response = supabase.table("shop_themes").select("*").execute()
+        send_json_with_etag(self, response.data)
+    
+    def get_settings(self):
+        send_json_with_etag(self, settings_cache.get_settings())
+    
+    def get_confirmation_codes(self):
+        # Коды подтверждают опасные действия — их видит только владелец
+        self.require_role('owner')
+        return supabase.table("confirmation_codes").select("*").execute().data
     
-    def do_PUT(self):
+    def get_orders_breakdown(self, days):
+        """Разбивка по статусам, товарам, дням и способу получения за последние days дней (МСК)"""
+        since = (datetime.now(MOSCOW_TZ) - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        summary = OrderSummary()
+        page_size = 1000
+        offset = 0
+        
+        while True:
+            response = supabase.table("orders").select(
+                "status_id,items,created_at,delivery_option,total_amount,discount_amount,final_amount"
+            ).gte("created_at", since.isoformat()).order("id").range(offset, offset + page_size - 1).execute()
+            for order in response.data:
+                summary.add(order)
+            if len(response.data) < page_size:
+                break
+            offset += page_size
+        
+        return summary.to_dict()
+    
+    def get_shop_stats(self):
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data)
-            
-            path_parts = self.path.split('/')
-            
-            if 'categories/reorder' in self.path:
-                categories_order = data.get('reorder', {})
-                for category_id, sort_order in categories_order.items():
-                    supabase.table("categories").update({"sort_order": sort_order}).eq("id", int(category_id)).execute()
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response_data = {'success': True}
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-                
-            elif 'category' in path_parts:
-                category_id = path_parts[-1] if path_parts[-1] else path_parts[-2]
-                
-                if not category_id.isdigit():
-                    self.send_response(400)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    response = {'success': False, 'error': 'Invalid category ID'}
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
-                    return
-                
-                response = supabase.table("categories").update(data).eq("id", int(category_id)).execute()
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                response_data = {'success': True, 'category': response.data[0] if response.data else None}
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-                
-            elif 'theme_id' in data:
-                theme_id = data['theme_id']
-                supabase.table("shop_themes").update({"is_active": False}).neq("id", 0).execute()
-                supabase.table("shop_themes").update({"is_active": True}).eq("id", theme_id).execute()
-                
-                existing = supabase.table("shop_settings").select("*").eq("key", "active_theme").execute()
-                if existing.data:
-                    supabase.table("shop_settings").update({"value": {"value": str(theme_id)}}).eq("key", "active_theme").execute()
-                else:
-                    supabase.table("shop_settings").insert({"key": "active_theme", "value": {"value": str(theme_id)}}).execute()
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                response_data = {'success': True}
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-            else:
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = {'success': False, 'error': 'Invalid request'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
-                
+            return supabase.rpc("shop_stats_summary", {}).execute().data[0]
         except Exception as e:
-            log_error("admin_PUT", e, self.headers.get('Telegram-Id', ''), f"Data: {data}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            print(f"shop_stats_summary RPC unavailable, reading shop_stats table: {e}")
+            return shop_stats.read_stats()
     
-    def do_DELETE(self):
-        try:
-            path_parts = self.path.split('/')
-            resource_id = path_parts[-1] if path_parts[-1] else path_parts[-2]
-            
-            if '/category/' in self.path:
-                response = supabase.table("categories").delete().eq("id", int(resource_id)).execute()
-                response_data = {'success': True}
-            elif '/admin/' in self.path and '/category/' not in self.path:
-                response = supabase.table("admins").delete().eq("id", int(resource_id)).execute()
-                response_data = {'success': True}
-            elif '/order/' in self.path:
-                response = supabase.table("orders").delete().eq("id", int(resource_id)).execute()
-                response_data = {'success': True}
-            else:
-                raise ValueError("Unknown resource")
+    def rebuild_stats(self):
+        # Полный пересчет по всем заказам: только владелец или вызов с CRON_SECRET, как у drain
+        if not self.is_cron_request():
+            self.require_role('owner')
+        shop_stats.rebuild()
+        return {'success': True, 'stats': self.get_shop_stats()}
+    
+    def save_settings(self):
+        # Все настройки магазина одним запросом: {"settings": {key: value, ...}}
+        self.require_role()
+        values = self.json_body.get('settings')
+        if not isinstance(values, dict) or not values or any(value is None for value in values.values()):
+            raise HttpError(400, 'Expected non-empty settings map')
+        
+        settings_cache.save_settings(values)
+        return {'success': True, 'saved': len(values)}
+    
+    def create_resource(self):
+        """POST /api/admin: администратор, категория или одна настройка — по полям тела"""
+        data = self.json_body
+        
+        if 'telegram_id' in data:
+            # Назначать администраторов и их роли может только владелец
+            self.require_role('owner')
+            admin_data = data
+            if 'is_active' not in admin_data:
+                admin_data['is_active'] = True
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
+            response = supabase.table("admins").insert(admin_data).execute()
+            invalidate_admin_cache()
+            return {'success': True, 'admin': response.data[0] if response.data else None}
+        
+        self.require_role()
+        
+        if 'name' in data and 'slug' in data:
+            category_data = {
+                'name': data['name'],
+                'slug': data['slug'],
+                'icon': data.get('icon', 'fas fa-folder'),
+                'sort_order': data.get('sort_order', 0),
+                'is_active': data.get('is_active', True)
+            }
             
-            self.wfile.write(json.dumps(response_data).encode('utf-8'))
+            max_order_response = supabase.table("categories").select("sort_order").order("sort_order", desc=True).limit(1).execute()
+            max_order = max_order_response.data[0]['sort_order'] if max_order_response.data else 0
+            category_data['sort_order'] = max_order + 1
             
-        except Exception as e:
-            log_error("admin_DELETE", e, self.headers.get('Telegram-Id', ''), f"Resource ID: {resource_id}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            response = supabase.table("categories").insert(category_data).execute()
+            return {'success': True, 'category': response.data[0] if response.data else None}
+        
+        key = data.get('key')
+        value = data.get('value')
+        if not key or value is None:
+            raise HttpError(400, 'Missing key or value')
+        
+        settings_cache.save_settings({key: value})
+        return {'success': True}
+    
+    def reorder_categories(self):
+        self.require_role()
+        changed = apply_sort_order("categories", self.json_body.get('reorder', {}))
+        return {'success': True, 'changed': len(changed)}
+    
+    def update_category(self, category_id):
+        self.require_role()
+        response = supabase.table("categories").update(self.json_body).eq("id", category_id).execute()
+        return {'success': True, 'category': response.data[0] if response.data else None}
+    
+    def set_active_theme(self):
+        self.require_role()
+        theme_id = self.json_body.get('theme_id')
+        if theme_id is None:
+            raise HttpError(400, 'Invalid request')
+        
+        supabase.table("shop_themes").update({"is_active": False}).neq("id", 0).execute()
+        supabase.table("shop_themes").update({"is_active": True}).eq("id", theme_id).execute()
+        settings_cache.save_settings({'active_theme': {'value': str(theme_id)}})
+        return {'success': True}
+    
+    def delete_admin(self, admin_id):
+        self.require_role('owner')
+        supabase.table("admins").delete().eq("id", admin_id).execute()
+        invalidate_admin_cache()
+        return {'success': True}
+    
+    def delete_category(self, category_id):
+        self.require_role()
+        supabase.table("categories").delete().eq("id", category_id).execute()
+        return {'success': True}
+    
+    def delete_order(self, order_id):
+        self.require_role()
+        response = supabase.table("orders").delete().eq("id", order_id).execute()
+        for deleted_order in response.data or []:
+            shop_stats.record_order_deleted(deleted_order)
+        return {'success': True}
@@ -0,0 +1,43 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+try:
+    from supabase_client import supabase
+except ImportError as e:
+    print(f"Import error: {e}")
+
+ADMIN_ROLE_TTL = int(os.environ.get('ADMIN_ROLE_TTL', '30'))
+
+# telegram_id -> (активная запись admins или None, время загрузки); None тоже кэшируется,
+# чтобы запросы обычных покупателей не ходили в базу
+_admin_cache = {}
+_admin_lock = threading.Lock()
+
+def get_admin(telegram_id):
+    """Активная запись администратора по Telegram-Id или None; ответ живет ADMIN_ROLE_TTL секунд"""
+    telegram_id = str(telegram_id or '').strip()
+    if not telegram_id:
+        return None
+    with _admin_lock:
+        cached = _admin_cache.get(telegram_id)
+        if cached and time.time() - cached[1] <= ADMIN_ROLE_TTL:
+            return cached[0]
+    
+    response = supabase.table("admins").select("id,telegram_id,role,is_active,first_name,username").eq("telegram_id", telegram_id).eq("is_active", True).execute()
+    admin = response.data[0] if response.data else None
+    with _admin_lock:
+        _admin_cache[telegram_id] = (admin, time.time())
+    return admin
+
+def get_admin_role(telegram_id):
+    admin = get_admin(telegram_id)
+    return admin.get('role') if admin else None
+
+def invalidate_admin_cache():
+    """Сбрасывает все записи: при удалении по id неизвестно, чей Telegram-Id затронут"""
+    with _admin_lock:
+        _admin_cache.clear()
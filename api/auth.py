@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qsl
+
+sys.path.append(os.path.dirname(__file__))
+
+try:
+    from admin_roles import get_admin_role
+    from routing import JsonHandler, HttpError, send_json
+except ImportError as e:
+    print(f"Import error: {e}")
+
+SESSION_TTL = int(os.environ.get('SESSION_TTL', '900'))
+INIT_DATA_MAX_AGE = int(os.environ.get('INIT_DATA_MAX_AGE', '86400'))
+
+# Ключи HMAC выводятся из BOT_TOKEN один раз на экземпляр функции
+_secrets = {}
+
+def webapp_secret(bot_token):
+    """Ключ проверки initData: HMAC-SHA256 с ключом "WebAppData" от токена бота"""
+    if bot_token not in _secrets:
+        _secrets[bot_token] = hmac.new(b'WebAppData', bot_token.encode('utf-8'), hashlib.sha256).digest()
+    return _secrets[bot_token]
+
+def session_secret():
+    """Ключ подписи сессий; None, если не задан ни SESSION_SECRET, ни BOT_TOKEN —
+    ключ от пустой строки позволил бы подделать любой токен"""
+    secret = os.environ.get('SESSION_SECRET') or os.environ.get('BOT_TOKEN')
+    if not secret:
+        return None
+    if ('session', secret) not in _secrets:
+        _secrets[('session', secret)] = hmac.new(b'ArtfloraSession', secret.encode('utf-8'), hashlib.sha256).digest()
+    return _secrets[('session', secret)]
+
+def b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def verify_init_data(init_data, bot_token):
+    """Пользователь из Telegram.WebApp.initData, если подпись верна и данные не старше INIT_DATA_MAX_AGE"""
+    fields = dict(parse_qsl(init_data or '', keep_blank_values=True))
+    received_hash = fields.pop('hash', '')
+    if not received_hash or 'user' not in fields:
+        return None
+    
+    data_check_string = '\n'.join(f'{key}={value}' for key, value in sorted(fields.items()))
+    expected_hash = hmac.new(webapp_secret(bot_token), data_check_string.encode('utf-8'), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected_hash, received_hash):
+        return None
+    
+    try:
+        if time.time() - int(fields.get('auth_date', 0)) > INIT_DATA_MAX_AGE:
+            return None
+        return json.loads(fields['user'])
+    except (ValueError, TypeError):
+        return None
+
+def issue_session_token(telegram_id, role=None):
+    """Токен вида payload.signature; роль в payload — подсказка для клиента, права на сервере
+    берутся из get_session"""
+    secret = session_secret()
+    if secret is None:
+        raise ValueError('SESSION_SECRET is not configured')
+    expires_at = int(time.time()) + SESSION_TTL
+    payload = b64encode(json.dumps({'sub': str(telegram_id), 'role': role, 'exp': expires_at}, separators=(',', ':')).encode('utf-8'))
+    signature = b64encode(hmac.new(secret, payload.encode('ascii'), hashlib.sha256).digest())
+    return f'{payload}.{signature}', expires_at
+
+def read_session_token(token):
+    secret = session_secret()
+    if secret is None:
+        return None
+    try:
+        payload, signature = (token or '').split('.')
+        expected = b64encode(hmac.new(secret, payload.encode('ascii'), hashlib.sha256).digest())
+        if not hmac.compare_digest(expected, signature):
+            return None
+        session = json.loads(b64decode(payload))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(session, dict) or session.get('exp', 0) <= time.time():
+        return None
+    return session
+
+def get_session(handler):
+    """Проверенная сессия запроса из заголовка Session-Token или None.
+    Роль перечитывается из admins через кэш admin_roles, а не берется из токена: снятие или смена роли
+    действует не через SESSION_TTL, а не позже чем через ADMIN_ROLE_TTL секунд на каждом экземпляре"""
+    session = read_session_token(handler.headers.get('Session-Token', ''))
+    if session:
+        session['role'] = get_admin_role(session.get('sub'))
+    return session
+
+def session_telegram_id(handler):
+    session = get_session(handler)
+    return session['sub'] if session else ''
+
+def session_role(handler):
+    session = get_session(handler)
+    return session.get('role') if session else None
+
+class Handler(JsonHandler):
+    log_name = 'auth'
+    allow_headers = 'Content-Type'
+    routes = [
+        ('POST', '/api/auth/session', 'create_session'),
+    ]
+    
+    def create_session(self):
+        bot_token = os.environ.get('BOT_TOKEN')
+        if not bot_token:
+            raise ValueError('BOT_TOKEN is not configured')
+        
+        user = verify_init_data(self.json_body.get('init_data', ''), bot_token)
+        if not user or not user.get('id'):
+            raise HttpError(401, 'Invalid initData')
+        
+        role = get_admin_role(user['id'])
+        token, expires_at = issue_session_token(user['id'], role)
+        
+        send_json(self, {
+            'success': True,
+            'token': token,
+            'expires_at': expires_at,
+            'telegram_id': str(user['id']),
+            'role': role,
+            'is_admin': role is not None
+        }, headers={'Cache-Control': 'no-store'})
@@ -0,0 +1,46 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(__file__))
+
+try:
+    from supabase_client import supabase
+    from http_cache import send_json_with_etag
+    from settings_cache import get_settings
+    from routing import JsonHandler
+except ImportError as e:
+    print(f"Import error: {e}")
+
+def fetch_products():
+    # Не кэш get_catalog из products.py: он живет в другой функции Vercel, и правки товаров
+    # сбрасывают только его. Здесь каталог всегда свежий, повторную передачу экономит ETag
+    return supabase.table("products").select("*").eq("is_available", True).order("sort_order").execute().data
+
+def fetch_categories():
+    return supabase.table("categories").select("*").order("sort_order").execute().data
+
+def fetch_themes():
+    return supabase.table("shop_themes").select("*").execute().data
+
+class Handler(JsonHandler):
+    log_name = 'bootstrap'
+    routes = [
+        ('GET', '/api/bootstrap', 'get_bootstrap'),
+    ]
+    
+    def get_bootstrap(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            products_future = executor.submit(fetch_products)
+            categories_future = executor.submit(fetch_categories)
+            settings_future = executor.submit(get_settings)
+            themes_future = executor.submit(fetch_themes)
+            
+            data = {
+                'products': products_future.result(),
+                'categories': categories_future.result(),
+                'settings': settings_future.result(),
+                'themes': themes_future.result()
+            }
+        
+        send_json_with_etag(self, data)
@@ -49,18 +49,18 @@ class Handler(BaseHTTPRequestHandler):
             self.send_header('Content-type', 'text/plain')
             self.end_headers()
             self.wfile.write(b'OK')
-            
+        
         except Exception as e:
             print(f"Error in bot handler: {e}")
             self.send_response(200)
             self.end_headers()
             self.wfile.write(b'OK')
-
+    
     def get_shop_status(self):
         moscow_tz = timezone(timedelta(hours=3))
         now = datetime.now(moscow_tz)
         current_hour = now.hour
-    
+        
         if 9 <= current_hour < 20:
             return "✅ *Открыто* • Закроется в 20:00"
         else:
@@ -68,7 +68,7 @@ class Handler(BaseHTTPRequestHandler):
                 return "❌ *Закрыто* • Откроется в 9:00"
             else:
                 return "❌ *Закрыто* • Откроется завтра в 9:00"
-
+    
     def get_admin_name(self, chat_id):
         admin_names = {
             "2032240231": "Ахмад",
@@ -76,7 +76,7 @@ class Handler(BaseHTTPRequestHandler):
             "766109005": "Амина"
         }
         return admin_names.get(str(chat_id), "Администратор")
-
+    
     def send_welcome_message(self, chat_id, bot_token, update):
         web_app_url = "https://flowershop-nine-ashy.vercel.app/"
         
@@ -101,7 +101,7 @@ class Handler(BaseHTTPRequestHandler):
 {shop_status}
 
 ✨ Используйте кнопки ниже для быстрого доступа."""
-            
+
             markup = {
                 "inline_keyboard": [
                     [{
@@ -117,7 +117,7 @@ class Handler(BaseHTTPRequestHandler):
                     ]
                 ]
             }
-            
+        
         else:
             caption = f"""*АртФлора | цветы Ярославль*
 *Цветы с доставкой по городу Ярославль* 🤍
@@ -136,7 +136,7 @@ class Handler(BaseHTTPRequestHandler):
 *АртФлора — когда цветы становятся искусством!*
 
 {shop_status}"""
-            
+
             markup = {
                 "inline_keyboard": [
                     [{
@@ -151,7 +151,7 @@ class Handler(BaseHTTPRequestHandler):
             }
         
         self.send_telegram_photo(chat_id, bot_token, photo_url, caption, markup)
-
+    
     def send_about_message(self, chat_id, bot_token):
         shop_status = self.get_shop_status()
         photo_url = "https://raw.githubusercontent.com/Fallout-rtg/flowershop/main/logo.jpg"
@@ -173,9 +173,9 @@ class Handler(BaseHTTPRequestHandler):
 🎉 *Работаем с 2025 года!*
 
 {shop_status}"""
-        
-        self.send_telegram_photo(chat_id, bot_token, photo_url, caption)
 
+        self.send_telegram_photo(chat_id, bot_token, photo_url, caption)
+    
     def send_catalog_message(self, chat_id, bot_token):
         web_app_url = "https://flowershop-nine-ashy.vercel.app/"
         photo_url = "https://raw.githubusercontent.com/Fallout-rtg/flowershop/main/logo.jpg"
@@ -191,17 +191,19 @@ class Handler(BaseHTTPRequestHandler):
         
         caption = "Нажмите на кнопку ниже, чтобы открыть каталог цветов:"
         self.send_telegram_photo(chat_id, bot_token, photo_url, caption, markup)
-
+    
     def send_stats_message(self, chat_id, bot_token):
         admin_ids = ["2032240231", "711090928", "766109005"]
         if str(chat_id) not in admin_ids:
             message = "❌ Эта команда доступна только администраторам."
             self.send_telegram_message(chat_id, bot_token, message)
             return
-            
+        
         try:
             import requests
-            response = requests.get('https://flowershop-nine-ashy.vercel.app/api/admin/stats', timeout=10)
+            # /api/admin/stats требует сессию администратора; бот вызывает его как сервер, с CRON_SECRET
+            headers = {'Authorization': f"Bearer {os.environ.get('CRON_SECRET', '')}"}
+            response = requests.get('https://flowershop-nine-ashy.vercel.app/api/admin/stats', headers=headers, timeout=10)
             
             if response.status_code == 200:
                 stats = response.json()
@@ -215,19 +217,19 @@ class Handler(BaseHTTPRequestHandler):
 🏷️ Активных промокодов: *{stats.get('active_promocodes', 0)}*"""
             else:
                 message = "❌ Не удалось получить статистику. Попробуйте позже."
-                
+        
         except Exception as e:
             message = f"❌ Ошибка при получении статистики: {str(e)}"
         
         self.send_telegram_message(chat_id, bot_token, message)
-
+    
     def run_system_test(self, chat_id, bot_token):
         admin_ids = ["2032240231", "711090928", "766109005"]
         if str(chat_id) not in admin_ids:
             message = "❌ Эта команда доступна только администраторам."
             self.send_telegram_message(chat_id, bot_token, message)
             return
-            
+        
         try:
             message = "🔄 *Запуск комплексной проверки системы...*\n\nПожалуйста, подождите 10-15 секунд..."
             self.send_telegram_message(chat_id, bot_token, message)
@@ -242,15 +244,15 @@ class Handler(BaseHTTPRequestHandler):
                 message = "❌ *Ошибка при выполнении проверки!*\n\nСистема мониторинга недоступна."
             
             self.send_telegram_message(chat_id, bot_token, message)
-            
+        
         except Exception as e:
             error_message = f"❌ *Ошибка при запуске проверки:*\n`{str(e)}`"
             self.send_telegram_message(chat_id, bot_token, error_message)
-
+    
     def send_unknown_command(self, chat_id, bot_token):
         message = "Извините, я не понимаю эту команду.\n\nДоступные команды:\n/start — начать работу\n/stats — статистика (админы)\n/test — проверка системы (админы)\n/catalog — каталог (админы)"
         self.send_telegram_message(chat_id, bot_token, message)
-
+    
     def send_telegram_message(self, chat_id, bot_token, text, reply_markup=None):
         url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
         payload = {
@@ -261,12 +263,12 @@ class Handler(BaseHTTPRequestHandler):
         
         if reply_markup:
             payload['reply_markup'] = json.dumps(reply_markup)
-            
+        
         try:
             requests.post(url, json=payload, timeout=10)
         except Exception as e:
             print(f"Error sending Telegram message: {e}")
-
+    
     def send_telegram_photo(self, chat_id, bot_token, photo_url, caption, reply_markup=None):
         url = f"https://api.telegram.org/bot{bot_token}/sendPhoto"
         payload = {
@@ -278,7 +280,7 @@ class Handler(BaseHTTPRequestHandler):
         
         if reply_markup:
             payload['reply_markup'] = json.dumps(reply_markup)
-            
+        
         try:
             response = requests.post(url, json=payload, timeout=10)
             if response.status_code != 200:
@@ -287,7 +289,7 @@ class Handler(BaseHTTPRequestHandler):
         except Exception as e:
             print(f"Error sending Telegram photo: {e}")
             self.send_telegram_message(chat_id, bot_token, caption, reply_markup)
-
+    
     def do_GET(self):
         self.send_response(200)
         self.send_header('Content-type', 'text/plain')
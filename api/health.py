@@ -45,7 +45,7 @@ class Handler(BaseHTTPRequestHandler):
             else:
                 self.send_response(404)
                 self.end_headers()
-                
+        
         except Exception as e:
             self.send_error_response(f"Health GET error: {str(e)}")
     
@@ -64,7 +64,7 @@ class Handler(BaseHTTPRequestHandler):
             
             response = {'success': True, 'message': 'Error logged'}
             self.wfile.write(json.dumps(response).encode('utf-8'))
-            
+        
         except Exception as e:
             self.send_error_response(f"Health POST error: {str(e)}")
     
@@ -98,7 +98,7 @@ class Handler(BaseHTTPRequestHandler):
                 test_report['overall_status'] = 'warning'
             else:
                 test_report['overall_status'] = 'healthy'
-            
+        
         except Exception as e:
             test_report['overall_status'] = 'error'
             test_report['errors'].append(f"Test execution failed: {str(e)}")
@@ -140,7 +140,7 @@ class Handler(BaseHTTPRequestHandler):
                 result['details']['products_count'] = response.count
             else:
                 result['details']['products_count'] = len(response.data) if response.data else 0
-                
+        
         except Exception as e:
             result['status'] = 'error'
             result['details']['connection'] = f'✗ Ошибка: {str(e)}'
@@ -172,11 +172,11 @@ class Handler(BaseHTTPRequestHandler):
                 else:
                     result['details']['message_permission'] = '✗ Не может отправлять сообщения'
                     result['status'] = 'warning'
-                    
+            
             else:
                 result['status'] = 'error'
                 result['details']['connection'] = f'✗ HTTP {response.status_code}'
-                
+        
         except Exception as e:
             result['status'] = 'error'
             result['details']['connection'] = f'✗ Ошибка: {str(e)}'
@@ -188,15 +188,17 @@ class Handler(BaseHTTPRequestHandler):
         base_url = "https://flowershop-nine-ashy.vercel.app"
         endpoints = [
             '/api/products',
-            '/api/admin',
+            '/api/admin/stats',
             '/api/order',
             '/api/promocodes'
         ]
+        # Административные эндпоинты отвечают 401 без сессии; health вызывает их как сервер, с CRON_SECRET
+        headers = {'Authorization': f"Bearer {os.environ.get('CRON_SECRET', '')}"}
         
         for endpoint in endpoints:
             try:
                 start_time = time.time()
-                response = requests.get(f"{base_url}{endpoint}", timeout=10)
+                response = requests.get(f"{base_url}{endpoint}", headers=headers, timeout=10)
                 response_time = round((time.time() - start_time) * 1000, 2)
                 
                 if response.status_code == 200:
@@ -204,7 +206,7 @@ class Handler(BaseHTTPRequestHandler):
                 else:
                     result['details'][endpoint] = f'✗ HTTP {response.status_code}'
                     result['status'] = 'warning'
-                    
+            
             except Exception as e:
                 result['details'][endpoint] = f'✗ Ошибка: {str(e)}'
                 result['status'] = 'warning'
@@ -227,7 +229,7 @@ class Handler(BaseHTTPRequestHandler):
                 
                 count = len(response.data) if response.data else 0
                 result['details'][table] = f'✓ Доступна ({count} записей)'
-                    
+            
             except Exception as e:
                 result['details'][table] = f'✗ Ошибка: {str(e)}'
                 result['status'] = 'error'
@@ -249,7 +251,7 @@ class Handler(BaseHTTPRequestHandler):
             
             stats['server_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             stats['python_version'] = sys.version.split()[0]
-            
+        
         except Exception as e:
             stats['error'] = f"Failed to get statistics: {str(e)}"
         
@@ -281,10 +283,10 @@ class Handler(BaseHTTPRequestHandler):
 {html.escape(additional_info)}
 
 🔧 <b>Требуется вмешательство!</b>"""
-            
+
             for chat_id in ADMIN_CHAT_IDS:
                 self.send_telegram_message(chat_id, bot_token, message, parse_mode='HTML')
-            
+        
         except Exception as e:
             print(f"Failed to log error to admins: {e}")
     
@@ -306,7 +308,7 @@ class Handler(BaseHTTPRequestHandler):
 
 <b>Проверка сервисов:</b>
 """
-            
+
             for service, data in report['services'].items():
                 status = data.get('status', 'unknown')
                 service_emoji = status_emoji.get(status, '❓')
@@ -335,9 +337,9 @@ class Handler(BaseHTTPRequestHandler):
                 print(f"❌ Failed to send report to {chat_id}")
             else:
                 print(f"✅ Report sent successfully to {chat_id}")
-                
-            return success
             
+            return success
+        
         except Exception as e:
             print(f"❌ Failed to send test report: {e}")
             return False
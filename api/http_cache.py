@@ -0,0 +1,36 @@
+import hashlib
+import json
+
+def make_etag(body):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Прокси (в т.ч. gzip на стороне Vercel) могут ослабить ETag до W/"..."
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in tags or f'W/{etag}' in tags
+
+def send_cached_json(handler, body, etag):
+    if etag_matches(handler.headers.get('If-None-Match', ''), etag):
+        handler.send_response(304)
+        handler.send_header('ETag', etag)
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.send_header('Access-Control-Allow-Origin', '*')
+        handler.end_headers()
+        return
+    
+    handler.send_response(200)
+    handler.send_header('Content-type', 'application/json')
+    handler.send_header('Content-Length', str(len(body)))
+    handler.send_header('ETag', etag)
+    handler.send_header('Cache-Control', 'no-cache')
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    handler.end_headers()
+    handler.wfile.write(body)
+
+def send_json_with_etag(handler, data):
+    body = json.dumps(data).encode('utf-8')
+    send_cached_json(handler, body, make_etag(body))
@@ -1,7 +1,4 @@
-from http.server import BaseHTTPRequestHandler
-import json
 import os
-import requests
 import sys
 
 sys.path.append(os.path.dirname(__file__))
@@ -9,55 +6,54 @@ sys.path.append(os.path.dirname(__file__))
 try:
     from supabase_client import supabase
     from health import log_error
+    import outbox
+    from routing import JsonHandler, HttpError
 except ImportError as e:
     print(f"Import error: {e}")
 
-class Handler(BaseHTTPRequestHandler):
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+class Handler(JsonHandler):
+    log_name = 'notifications'
+    allow_headers = 'Content-Type, Session-Token'
+    routes = [
+        ('GET', '/api/notifications/drain', 'drain_outbox'),
+        ('POST', '/api/notifications', 'send_notification'),
+    ]
     
-    def do_POST(self):
-        try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            notification_data = json.loads(post_data)
-            
-            user_id = notification_data.get('user_id')
-            message = notification_data.get('message')
-            notification_type = notification_data.get('type', 'info')
-            
-            success = self.send_telegram_notification(user_id, message)
-            
-            if success:
-                notification_record = {
-                    "user_id": user_id,
-                    "type": notification_type,
-                    "title": "Уведомление",
-                    "message": message,
-                    "is_sent": True
-                }
-                supabase.table("notifications").insert(notification_record).execute()
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            response = {'success': success}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
-            
-        except Exception as e:
-            log_error("notifications", e, notification_data.get('user_id', ''), "Failed to send notification")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+    def drain_outbox(self):
+        # Vercel Cron передает CRON_SECRET в заголовке Authorization.
+        # Основная доставка — немедленная попытка в том же запросе, что поставил сообщение в outbox;
+        # drain лишь добирает остаток. В vercel.json он раз в сутки: чаще Hobby-план не разрешает,
+        # на Pro можно поставить */5 * * * *
+        if not self.is_cron_request():
+            raise HttpError(401, 'Unauthorized')
+        
+        limit = self.query_param('limit')
+        limit = min(int(limit), 500) if limit.isdigit() else outbox.DRAIN_BATCH_SIZE
+        
+        summary = outbox.drain(os.environ.get('BOT_TOKEN'), limit)
+        return {'success': True, **summary}
+    
+    def send_notification(self):
+        # Произвольное сообщение от имени бота — только для администраторов
+        self.require_role()
+        notification_data = self.json_body
+        user_id = notification_data.get('user_id')
+        message = notification_data.get('message')
+        notification_type = notification_data.get('type', 'info')
+        
+        success = self.send_telegram_notification(user_id, message)
+        
+        if success:
+            notification_record = {
+                "user_id": user_id,
+                "type": notification_type,
+                "title": "Уведомление",
+                "message": message,
+                "is_sent": True
+            }
+            supabase.table("notifications").insert(notification_record).execute()
+        
+        return {'success': success}
     
     def send_telegram_notification(self, user_id, message):
         try:
@@ -66,17 +62,10 @@ class Handler(BaseHTTPRequestHandler):
             if not bot_token:
                 log_error("telegram_notification", "Missing BOT_TOKEN", user_id, "Failed to send Telegram notification")
                 return False
-
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-            payload = {
-                'chat_id': user_id,
-                'text': message,
-                'parse_mode': 'Markdown'
-            }
-            
-            response = requests.post(url, json=payload, timeout=10)
-            return response.status_code == 200
             
+            message = outbox.make_message(user_id, message, source='notification', parse_mode='Markdown')
+            return outbox.send(bot_token, [message])[0]
+        
         except Exception as e:
             log_error("telegram_notification", e, user_id, "Failed to send Telegram notification")
             return False
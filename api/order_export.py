@@ -0,0 +1,711 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import requests
+import sys
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(__file__))
+
+try:
+    from supabase_init import supabase
+    from health import log_error
+    from order_summary import OrderSummary, MOSCOW_TZ, to_moscow, moscow_date_to_utc
+    import telegram_client
+except ImportError as e:
+    print(f"Import error: {e}")
+
+# openpyxl заметно удлиняет холодный старт, поэтому этот модуль импортируется
+# из order.py только в маршрутах экспорта, а не при оформлении заказа
+try:
+    import openpyxl
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
+    from openpyxl.worksheet.page import PageMargins
+    from openpyxl.styles import NamedStyle
+    from openpyxl.cell import WriteOnlyCell
+except ImportError as e:
+    print(f"⚠️ Openpyxl import error: {e}")
+    # Создаем заглушки для совместимости
+    openpyxl = None
+
+# Карта статусов для отчетов: название и цвет
+EXPORT_STATUSES = {
+    1: ('🆕 Новый', 'FF6B6B'),
+    2: ('✅ Подтвержден', 'FFA726'),
+    3: ('📦 Собирается', '8E44AD'),
+    4: ('🚚 В пути', '3498DB'),
+    5: ('🎉 Доставлен', '27AE60'),
+    6: ('❌ Отменен', '95A5A6')
+}
+EXPORT_MONEY_FORMAT = '#,##0 ₽'
+
+def add_export_styles(wb):
+    """Регистрирует именованные стили отчета; ячейки ссылаются на них по имени, без объектов стилей на каждую ячейку"""
+    border = Border(
+        left=Side(style='thin', color='D9D9D9'),
+        right=Side(style='thin', color='D9D9D9'),
+        top=Side(style='thin', color='D9D9D9'),
+        bottom=Side(style='thin', color='D9D9D9')
+    )
+    center = Alignment(horizontal='center', vertical='center')
+    left = Alignment(horizontal='left', vertical='center')
+    wrap_center = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    wrap_left = Alignment(horizontal='left', vertical='center', wrap_text=True)
+    
+    def calibri(size=10, **kwargs):
+        return Font(name='Calibri', size=size, **kwargs)
+    
+    # имя: (шрифт, заливка, выравнивание, рамка, формат числа)
+    specs = {
+        'title_blue': (calibri(16, bold=True, color='FFFFFF'), '4F81BD', center, False, None),
+        'title_green': (calibri(16, bold=True, color='FFFFFF'), '27AE60', center, False, None),
+        'title_purple': (calibri(16, bold=True, color='FFFFFF'), '8E44AD', center, False, None),
+        'title_red': (calibri(16, bold=True, color='FFFFFF'), 'E74C3C', center, False, None),
+        'subtitle': (calibri(10, italic=True, color='7F7F7F'), None, center, False, None),
+        'header_blue': (calibri(11, bold=True, color='FFFFFF'), '366092', wrap_center, True, None),
+        'header_green': (calibri(11, bold=True, color='FFFFFF'), '27AE60', wrap_center, True, None),
+        'header_red': (calibri(11, bold=True, color='FFFFFF'), 'E74C3C', wrap_center, True, None),
+        'cell': (calibri(), None, center, True, None),
+        'cell_bold': (calibri(bold=True), None, center, True, None),
+        'cell_wrap': (calibri(), None, wrap_center, True, None),
+        'products': (calibri(color='2E4053'), None, Alignment(horizontal='left', vertical='top', wrap_text=True), True, None),
+        'product_name': (calibri(color='2E4053'), None, left, True, None),
+        'comment': (calibri(9, color='7F8C8D'), None, wrap_left, True, None),
+        'money': (calibri(bold=True, color='1F4E78'), None, center, True, EXPORT_MONEY_FORMAT),
+        'money_discount': (calibri(color='E74C3C'), None, center, True, EXPORT_MONEY_FORMAT),
+        'money_green': (calibri(bold=True, color='27AE60'), None, center, True, EXPORT_MONEY_FORMAT),
+        'summary_title': (calibri(12, bold=True, color='FFFFFF'), '4F81BD', center, False, None),
+        'summary_products': (Font(bold=True, color='2E86C1'), None, center, False, None),
+        'summary_amount': (Font(bold=True, color='27AE60'), None, center, False, EXPORT_MONEY_FORMAT),
+        'summary_final': (Font(bold=True, color='E74C3C'), None, center, False, EXPORT_MONEY_FORMAT),
+        'metric_value': (calibri(14, bold=True), None, center, True, None),
+        'value_bold': (calibri(bold=True), None, center, False, None),
+        'value_percent': (calibri(), None, center, False, '0.0"% "'),
+        'status_unknown': (calibri(bold=True), 'CCCCCC', center, True, None)
+    }
+    
+    for status_id, (_, color) in EXPORT_STATUSES.items():
+        specs[f'status_{status_id}'] = (calibri(bold=True), color, center, True, None)
+        specs[f'status_label_{status_id}'] = (calibri(bold=True), color + '20', left, False, None)
+    for color in ('4F81BD', '3498DB', '27AE60', 'E74C3C', '9B59B6', 'F39C12', '16A085', '2C3E50'):
+        specs[f'metric_{color}'] = (calibri(11, bold=True, color='FFFFFF'), color, center, False, None)
+    
+    # Колонки листа «Топ товаров» и их вариант с заливкой четных строк
+    top_columns = {
+        'top_name': (calibri(bold=True), left, None),
+        'top_quantity': (calibri(bold=True, color='3498DB'), center, None),
+        'top_revenue': (calibri(bold=True, color='27AE60'), center, EXPORT_MONEY_FORMAT),
+        'top_share': (calibri(color='8E44AD'), center, '0.0"%"'),
+        'top_rating': (calibri(bold=True, color='E74C3C'), center, None)
+    }
+    for name, (font, alignment, number_format) in top_columns.items():
+        specs[name] = (font, None, alignment, True, number_format)
+        specs[name + '_alt'] = (font, 'F8F9F9', alignment, True, number_format)
+    
+    for name, (font, fill, alignment, bordered, number_format) in specs.items():
+        style = NamedStyle(name=name)
+        style.font = font
+        style.alignment = alignment
+        if fill:
+            style.fill = PatternFill(start_color=fill, end_color=fill, fill_type='solid')
+        if bordered:
+            style.border = border
+        if number_format:
+            style.number_format = number_format
+        wb.add_named_style(style)
+
+def export_cell(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+EXPORT_PAGE_SIZE = 1000
+
+def fetch_export_orders(date_from='', date_to='', after_id=None):
+    """Заказы для отчета: период по московским датам и/или только новее водяного знака.
+    Читаются страницами, потому что PostgREST отдает не больше 1000 строк за запрос."""
+    orders = []
+    offset = 0
+    while True:
+        query = supabase.table("orders").select("*")
+        if date_from:
+            query = query.gte("created_at", moscow_date_to_utc(date_from))
+        if date_to:
+            query = query.lt("created_at", moscow_date_to_utc(date_to, days=1))
+        if after_id:
+            query = query.gt("id", after_id)
+        response = query.order("created_at.desc,id", desc=True).range(offset, offset + EXPORT_PAGE_SIZE - 1).execute()
+        orders.extend(response.data)
+        if len(response.data) < EXPORT_PAGE_SIZE:
+            return orders
+        offset += EXPORT_PAGE_SIZE
+
+def get_export_watermark(telegram_id):
+    response = supabase.table("export_watermarks").select("last_order_id").eq("telegram_id", str(telegram_id)).execute()
+    return response.data[0]['last_order_id'] if response.data else 0
+
+def set_export_watermark(telegram_id, last_order_id):
+    try:
+        supabase.table("export_watermarks").upsert({
+            'telegram_id': str(telegram_id),
+            'last_order_id': last_order_id,
+            'exported_at': datetime.now(timezone.utc).isoformat()
+        }, on_conflict='telegram_id').execute()
+    except Exception as e:
+        log_error("export_watermark", e, telegram_id, f"Last order ID: {last_order_id}")
+
+def describe_export_period(date_from='', date_to='', since_last=False):
+    def russian_date(date_str):
+        return datetime.strptime(date_str, '%Y-%m-%d').strftime('%d.%m.%Y')
+    
+    parts = []
+    if since_last:
+        parts.append('новые заказы с прошлого экспорта')
+    if date_from and date_to:
+        parts.append(f'{russian_date(date_from)} — {russian_date(date_to)}')
+    elif date_from:
+        parts.append(f'с {russian_date(date_from)}')
+    elif date_to:
+        parts.append(f'по {russian_date(date_to)}')
+    return ', '.join(parts) or 'все заказы'
+
+EXPORT_PROGRESS_STEP = 500
+EXPORT_JOB_FIELDS = ('status', 'progress', 'stage', 'total_orders', 'message', 'error', 'created_at', 'finished_at')
+
+def create_export_job(telegram_id, params):
+    response = supabase.table("export_jobs").insert({
+        'telegram_id': str(telegram_id),
+        'params': params,
+        'status': 'queued',
+        'progress': 0
+    }).execute()
+    return response.data[0]
+
+def update_export_job(job_id, **fields):
+    """Ошибка записи прогресса не должна прерывать сам экспорт"""
+    fields['updated_at'] = datetime.now(timezone.utc).isoformat()
+    try:
+        supabase.table("export_jobs").update(fields).eq("id", job_id).execute()
+    except Exception as e:
+        log_error("export_job_update", e, "", f"Job ID: {job_id}")
+
+def claim_export_job(job_id=None):
+    """Переводит задачу в running; None, если ее уже забрал другой воркер"""
+    response = supabase.rpc("export_job_claim", {'p_id': job_id}).execute()
+    return response.data[0] if response.data else None
+
+def get_export_job(job_id):
+    response = supabase.table("export_jobs").select("*").eq("id", job_id).execute()
+    return response.data[0] if response.data else None
+
+REPORT_CACHE_SIZE = 8
+
+# Последние отчеты этого экземпляра — только file_id и подписи, без байтов файла:
+# если Telegram не принял file_id, отчет просто собирается заново
+_report_cache = {}
+
+def report_cache_key(date_from='', date_to='', after_id=None):
+    """Ключ отчета: состояние таблицы orders (max id, max updated_at, число строк) + параметры"""
+    watermark = supabase.rpc("orders_watermark", {}).execute().data[0]
+    raw = json.dumps([watermark, date_from, date_to, after_id], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def get_cached_report(cache_key):
+    if cache_key in _report_cache:
+        return _report_cache[cache_key]
+    response = supabase.table("export_reports").select("*").eq("cache_key", cache_key).execute()
+    return response.data[0] if response.data else None
+
+def store_cached_report(cache_key, report):
+    _report_cache[cache_key] = report
+    while len(_report_cache) > REPORT_CACHE_SIZE:
+        _report_cache.pop(next(iter(_report_cache)))
+    try:
+        row = {field: report.get(field) for field in ('file_id', 'file_name', 'caption', 'message', 'total_orders', 'last_order_id')}
+        row['cache_key'] = cache_key
+        supabase.table("export_reports").upsert(row, on_conflict='cache_key').execute()
+    except Exception as e:
+        log_error("export_report_cache", e, "", f"Cache key: {cache_key}")
+
+def send_cached_report(bot_token, user_id, report):
+    """Повторная отправка готового отчета по file_id"""
+    resp = telegram_client.call_api(
+        bot_token, 'sendDocument',
+        {'chat_id': user_id, 'document': report['file_id'], 'caption': report.get('caption') or ''},
+        timeout=30
+    )
+    print(f"📩 Ответ Telegram API (кэш): {resp.status_code}")
+    if resp.status_code == 200:
+        return {'success': True, 'message': report.get('message') or 'Отчет отправлен в Telegram'}
+    return {'success': False, 'error': f'Ошибка отправки: {resp.status_code}'}
+
+def sent_document(resp, file_name, caption):
+    """Данные отправленного файла для кэша отчетов"""
+    try:
+        file_id = resp.json()['result']['document']['file_id']
+    except Exception:
+        return None
+    return {'file_id': file_id, 'file_name': file_name, 'caption': caption}
+
+def export_worker_url():
+    """Адрес воркера только из окружения: CRON_SECRET не отправляется на хост из заголовка запроса.
+    VERCEL_URL не подходит: адрес конкретного деплоя закрыт Deployment Protection, а домен
+    продакшена (VERCEL_PROJECT_PRODUCTION_URL) — нет"""
+    if os.environ.get('EXPORT_WORKER_URL'):
+        return os.environ['EXPORT_WORKER_URL']
+    if os.environ.get('VERCEL_PROJECT_PRODUCTION_URL'):
+        return f"https://{os.environ['VERCEL_PROJECT_PRODUCTION_URL']}/api/order/export/run"
+    return None
+
+def trigger_export_worker(job_id):
+    """Запускает воркер отдельным вызовом функции и не ждет, пока он закончит.
+    True — воркер принял задачу: ответил 2xx или не успел ответить за секунду, то есть работает.
+    False — вызов не дошел или отклонен (401 от Deployment Protection, 404), задачу выполняет вызывающий."""
+    url = export_worker_url()
+    if not url:
+        log_error("export_worker_trigger", "EXPORT_WORKER_URL and VERCEL_PROJECT_PRODUCTION_URL are not set", "", f"Job ID: {job_id}")
+        return False
+    try:
+        response = requests.post(
+            url,
+            json={'job_id': job_id},
+            headers={'Authorization': f"Bearer {os.environ.get('CRON_SECRET')}"},
+            timeout=(3, 1)
+        )
+    except requests.exceptions.ReadTimeout:
+        return True
+    except Exception as e:
+        log_error("export_worker_trigger", e, "", f"Job ID: {job_id}")
+        return False
+    if not response.ok:
+        log_error("export_worker_trigger", f"HTTP {response.status_code}", "", f"Job ID: {job_id}, URL: {url}")
+    return response.ok
+
+def run_export_job(job):
+    """Выполняет задачу экспорта: выборка, сборка файла, отправка в Telegram.
+    Ход работы пишется в export_jobs, итог возвращается обновленной строкой задачи."""
+    job_id = job['id']
+    user_id = job['telegram_id']
+    params = job.get('params') or {}
+    date_from = params.get('from', '')
+    date_to = params.get('to', '')
+    since_last = params.get('since_last', False)
+    
+    def progress(stage, percent, **fields):
+        job.update(stage=stage, progress=percent, **fields)
+        update_export_job(job_id, stage=stage, progress=percent, **fields)
+    
+    try:
+        bot_token = os.environ.get('BOT_TOKEN')
+        if not bot_token:
+            raise ValueError('Отсутствует BOT_TOKEN')
+        
+        job['status'] = 'running'
+        progress('fetching', 10, status='running')
+        
+        after_id = get_export_watermark(user_id) if since_last else None
+        period_label = describe_export_period(date_from, date_to, since_last)
+        
+        # Пока заказы не менялись, такой же отчет уже лежит в Telegram — отправляем его по file_id
+        cache_key = report_cache_key(date_from, date_to, after_id)
+        cached = get_cached_report(cache_key)
+        
+        if cached:
+            print(f"♻️ Задача {job_id}: отчет найден в кэше, отправляем повторно")
+            progress('sending', 90, total_orders=cached.get('total_orders'))
+            result = send_cached_report(bot_token, user_id, cached)
+            if result['success']:
+                if since_last and cached.get('last_order_id'):
+                    set_export_watermark(user_id, cached['last_order_id'])
+                return finish_export_job(job, result, progress)
+            # file_id не принят — собираем отчет заново, новый file_id заменит запись в кэше
+            print(f"⚠️ Задача {job_id}: {result['error']}, пересобираем отчет")
+            _report_cache.pop(cache_key, None)
+        
+        print(f"📋 Задача {job_id}: запрашиваем заказы ({period_label})...")
+        orders = fetch_export_orders(date_from, date_to, after_id)
+        
+        if not orders:
+            print("⚠️ Нет данных для экспорта")
+            result = {
+                'success': True,
+                'message': 'Нет новых заказов с прошлого экспорта' if since_last else 'Нет данных для экспорта'
+            }
+        else:
+            print(f"✅ Найдено {len(orders)} заказов")
+            progress('building', 30, total_orders=len(orders))
+            
+            # Проверяем, установлен ли openpyxl
+            if openpyxl is None:
+                print("⚠️ Библиотека openpyxl не установлена, используем CSV")
+                result = export_to_csv(orders, bot_token, user_id, period_label, progress)
+            else:
+                result = export_to_excel(orders, bot_token, user_id, period_label, progress)
+            
+            last_order_id = max(order['id'] for order in orders)
+            
+            # Водяной знак двигаем только после доставки файла
+            if result['success'] and since_last:
+                set_export_watermark(user_id, last_order_id)
+            
+            if result['success'] and result.get('report'):
+                result['report'].update(message=result['message'], total_orders=len(orders), last_order_id=last_order_id)
+                store_cached_report(cache_key, result['report'])
+    
+    except Exception as e:
+        log_error("export_job", e, user_id, f"Job ID: {job_id}")
+        result = {'success': False, 'error': f'Ошибка сервера: {e}'}
+    
+    return finish_export_job(job, result, progress)
+
+def finish_export_job(job, result, progress):
+    job['status'] = 'done' if result['success'] else 'failed'
+    progress(
+        'finished', 100,
+        status=job['status'],
+        message=result.get('message'),
+        error=result.get('error'),
+        finished_at=datetime.now(timezone.utc).isoformat()
+    )
+    print(f"🏁 Задача экспорта {job['id']}: {job['status']}")
+    return job
+
+def export_to_excel(orders, bot_token, user_id, period_label=None, progress=None):
+    """Создание и отправка Excel файла: книга write-only, все данные собираются за один проход по заказам.
+    Возвращает {'success', 'message' | 'error'}; progress(stage, percent) сообщает о ходе работы."""
+    try:
+        print("📊 Создаем профессиональный Excel отчет...")
+        
+        # write-only: строки сразу уходят во временные файлы листов, а не хранятся объектами ячеек
+        wb = Workbook(write_only=True)
+        add_export_styles(wb)
+        
+        # Листы создаются заранее: детализация и чеки заполняются параллельно в одном проходе
+        ws1 = wb.create_sheet(title="📋 Детализация заказов")
+        ws2 = wb.create_sheet(title="📊 Топ товаров")
+        ws3 = wb.create_sheet(title="📈 Аналитика")
+        ws4 = wb.create_sheet(title="🧾 Детальные чеки")
+        
+        # Вид листа, поля и ширины пишутся до первой строки
+        column_widths = {
+            ws1: [5, 10, 12, 18, 23.57, 45, 12, 12, 12, 12, 10, 12, 25],
+            ws2: [45, 15, 15, 15, 12],
+            ws3: [25, 15, 15, 25, 15, 15],
+            ws4: [10, 12, 18, 40, 10, 12, 12]
+        }
+        for ws, widths in column_widths.items():
+            ws.page_margins = PageMargins(left=0.4, right=0.4, top=0.5, bottom=0.5, header=0.3, footer=0.3)
+            ws.sheet_view.showGridLines = False
+            for i, width in enumerate(widths, 1):
+                ws.column_dimensions[get_column_letter(i)].width = width
+        
+        # ===== ЛИСТ 1: ДЕТАЛИЗАЦИЯ ЗАКАЗОВ (шапка) =====
+        moscow_time = datetime.now(MOSCOW_TZ)
+        ws1.merged_cells.add('A1:M1')
+        ws1.merged_cells.add('A2:M2')
+        ws1.append([export_cell(ws1, "📊 Отчет по заказам - АРТФЛОРА", 'title_blue')])
+        ws1.append([export_cell(ws1, f"Сформирован: {moscow_time.strftime('%d.%m.%Y %H:%M')} (МСК)", 'subtitle')])
+        ws1.append([])
+        headers = [
+            '№', 'ID заказа', 'Дата создания', 'Клиент', 'Телефон',
+            'Состав заказа', 'Кол-во товаров', 'Сумма (₽)', 'Скидка (₽)', 
+            'Итог (₽)', 'Способ', 'Статус', 'Примечание'
+        ]
+        ws1.append([export_cell(ws1, header, 'header_blue') for header in headers])
+        
+        # ===== ЛИСТ 4: ДЕТАЛЬНЫЕ ЧЕКИ (шапка) =====
+        ws4.merged_cells.add('A1:G1')
+        ws4.append([export_cell(ws4, "🧾 Подробные чеки по заказам", 'title_red')])
+        ws4.append([])
+        check_headers = [
+            'Заказ №', 'Дата', 'Клиент', 'Товар', 
+            'Кол-во', 'Цена (₽)', 'Сумма (₽)'
+        ]
+        ws4.append([export_cell(ws4, header, 'header_red') for header in check_headers])
+        
+        # Один разбор каждого заказа: строки листов и все итоги берутся из OrderSummary
+        summary = OrderSummary()
+        
+        row_num = 5
+        for idx, order in enumerate(orders, 1):
+            parsed = summary.add(order)
+            if progress and idx % EXPORT_PROGRESS_STEP == 0:
+                progress('building', 30 + 50 * idx // len(orders))
+            
+            # Форматируем дату (МОСКОВСКОЕ ВРЕМЯ)
+            order_time = ''
+            order_date = ''
+            if parsed['moscow_dt']:
+                order_time = parsed['moscow_dt'].strftime('%d.%m.%Y\n%H:%M')
+                order_date = parsed['moscow_dt'].strftime('%d.%m.%Y')
+            elif order.get('created_at'):
+                order_time = order_date = str(order['created_at'])
+            
+            status_id = order['status_id']
+            status_text = EXPORT_STATUSES.get(status_id, ('❓ Неизвестен', 'CCCCCC'))[0]
+            status_style = f'status_{status_id}' if status_id in EXPORT_STATUSES else 'status_unknown'
+            
+            # Форматируем телефон
+            phone = order['phone']
+            if len(phone) >= 10:
+                formatted_phone = f"+7 ({phone[1:4]}) {phone[4:7]}-{phone[7:9]}-{phone[9:11]}"
+            else:
+                formatted_phone = phone
+            
+            items_text_parts = []
+            for item in parsed['items']:
+                item_name = item.get('name', 'Неизвестный товар')
+                item_quantity = item.get('quantity', 0)
+                item_total = item.get('total', 0)
+                
+                items_text_parts.append(f"• {item_name} × {item_quantity} шт. = {item_total} ₽")
+                
+                ws4.append([
+                    export_cell(ws4, order['id'], 'cell_bold'),
+                    export_cell(ws4, order_date, 'cell'),
+                    export_cell(ws4, order['user_name'], 'cell'),
+                    export_cell(ws4, item_name, 'product_name'),
+                    export_cell(ws4, item_quantity, 'cell'),
+                    export_cell(ws4, item.get('price', 0), 'money'),
+                    export_cell(ws4, item_total, 'money_green')
+                ])
+            
+            delivery_type = 'Доставка' if parsed['delivery'] == 'delivery' else 'Самовывоз'
+            
+            # Высота строки по числу товаров задается до записи строки
+            ws1.row_dimensions[row_num].height = max(50, max(len(items_text_parts), 1) * 15)
+            ws1.append([
+                export_cell(ws1, idx, 'cell'),
+                export_cell(ws1, order['id'], 'cell_bold'),
+                export_cell(ws1, order_time, 'cell_wrap'),
+                export_cell(ws1, order['user_name'], 'cell'),
+                export_cell(ws1, formatted_phone, 'cell'),
+                export_cell(ws1, "\n".join(items_text_parts), 'products'),
+                export_cell(ws1, parsed['items_count'], 'cell_bold'),
+                export_cell(ws1, order['total_amount'], 'money'),
+                export_cell(ws1, order.get('discount_amount', 0), 'money_discount'),
+                export_cell(ws1, order['final_amount'], 'money_green'),
+                export_cell(ws1, delivery_type, 'cell'),
+                export_cell(ws1, status_text, status_style),
+                export_cell(ws1, order.get('comment', ''), 'comment')
+            ])
+            
+            row_num += 1
+        
+        # Итоговая строка детализации
+        summary_row = row_num + 1
+        ws1.append([])
+        ws1.merged_cells.add(f'A{summary_row}:F{summary_row}')
+        ws1.append(
+            [export_cell(ws1, '📈 ИТОГОВАЯ СТАТИСТИКА', 'summary_title')] + [None] * 5 + [
+                export_cell(ws1, f"📦 {summary.total_products} шт", 'summary_products'),
+                export_cell(ws1, f"💰 {summary.total_amount:,} ₽", 'summary_amount'),
+                None,
+                export_cell(ws1, f"💎 {summary.total_final:,} ₽", 'summary_final')
+            ]
+        )
+        
+        # ===== ЛИСТ 2: СТАТИСТИКА ПО ТОВАРАМ =====
+        ws2.merged_cells.add('A1:E1')
+        ws2.merged_cells.add('A2:E2')
+        ws2.append([export_cell(ws2, "📦 Статистика продаж по товарам", 'title_green')])
+        ws2.append([export_cell(ws2, f"Всего уникальных товаров: {len(summary.products)}", 'subtitle')])
+        ws2.append([])
+        stats_headers = [
+            '🏷️ Товар', '📦 Продано (шт)', '💰 Выручка (₽)', 
+            '📊 Доля в продажах (%)', '🏅 Рейтинг'
+        ]
+        ws2.append([export_cell(ws2, header, 'header_green') for header in stats_headers])
+        
+        # Товары по убыванию количества продаж
+        for idx, (product_name, quantity, revenue) in enumerate(summary.top_products(), 1):
+            percentage = (quantity / summary.total_products * 100) if summary.total_products > 0 else 0
+            
+            # Определяем рейтинг
+            if idx == 1:
+                rating = "🥇 ЛИДЕР"
+            elif idx == 2:
+                rating = "🥈 ТОП-2"
+            elif idx == 3:
+                rating = "🥉 ТОП-3"
+            elif idx <= 10:
+                rating = f"⭐ ТОП-{idx}"
+            else:
+                rating = f"#{idx}"
+            
+            # Заливка для четных строк — отдельный набор стилей с суффиксом _alt
+            suffix = '_alt' if idx % 2 == 0 else ''
+            ws2.append([
+                export_cell(ws2, product_name, 'top_name' + suffix),
+                export_cell(ws2, quantity, 'top_quantity' + suffix),
+                export_cell(ws2, revenue, 'top_revenue' + suffix),
+                export_cell(ws2, round(percentage, 1), 'top_share' + suffix),
+                export_cell(ws2, rating, 'top_rating' + suffix)
+            ])
+        
+        # ===== ЛИСТ 3: АНАЛИТИКА И СВОДКА =====
+        ws3.merged_cells.add('A1:C1')
+        ws3.append([export_cell(ws3, "📊 Аналитическая сводка", 'title_purple')])
+        ws3.append([])
+        
+        metrics = [
+            ("📊 Общее количество заказов", f"{summary.total_orders:,}", "4F81BD"),
+            ("📦 Всего товаров продано", f"{summary.total_products:,} шт", "3498DB"),
+            ("💰 Общая выручка", f"{summary.total_amount:,} ₽", "27AE60"),
+            ("🎫 Сумма скидок", f"{summary.total_discount:,} ₽", "E74C3C"),
+            ("💎 Итоговая сумма", f"{summary.total_final:,} ₽", "9B59B6"),
+            ("🚚 Заказов с доставкой", f"{summary.delivery_counts['delivery']:,}", "F39C12"),
+            ("🏪 Заказов самовывозом", f"{summary.delivery_counts['pickup']:,}", "16A085"),
+            ("📈 Средний чек", f"{summary.average_check():,} ₽", "2C3E50"),
+        ]
+        
+        # Метрики парами: строка меток (A:B и D:E) и строка значений под ними
+        metric_row = 3
+        for i in range(0, len(metrics), 2):
+            labels = []
+            values = []
+            for j, (label, value, color) in enumerate(metrics[i:i + 2]):
+                col = j * 3 + 1
+                ws3.merged_cells.add(f'{get_column_letter(col)}{metric_row}:{get_column_letter(col + 1)}{metric_row}')
+                ws3.merged_cells.add(f'{get_column_letter(col)}{metric_row + 1}:{get_column_letter(col + 1)}{metric_row + 1}')
+                labels += [export_cell(ws3, label, f'metric_{color}'), None, None]
+                values += [export_cell(ws3, value, 'metric_value'), None, None]
+            ws3.append(labels)
+            ws3.append(values)
+            metric_row += 2
+        
+        # Статистика по статусам
+        status_row = 13
+        while metric_row < status_row:
+            ws3.append([])
+            metric_row += 1
+        ws3.merged_cells.add(f'A{status_row}:C{status_row}')
+        ws3.append([export_cell(ws3, "📋 Распределение по статусам", 'summary_title')])
+        
+        for status_id, (status_name, status_color) in EXPORT_STATUSES.items():
+            count = summary.status_counts.get(status_id, 0)
+            percentage = (count / summary.total_orders * 100) if summary.total_orders > 0 else 0
+            ws3.append([
+                export_cell(ws3, status_name, f'status_label_{status_id}'),
+                export_cell(ws3, count, 'value_bold'),
+                export_cell(ws3, f"{percentage:.1f}%", 'value_percent')
+            ])
+        
+        # Книга собирается в памяти: файловая система функции только для чтения, кроме /tmp
+        print("📁 Сохраняем Excel файл...")
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+        print(f"✅ Файл создан: {buffer.getbuffer().nbytes} байт")
+        
+        print("📤 Отправляем файл в Telegram...")
+        if progress:
+            progress('sending', 90)
+        file_name = 'Отчет_АРТФЛОРА.xlsx'
+        caption = '📊 Профессиональный отчет АРТФЛОРА\n\n• 📋 Детализация заказов\n• 📊 Топ товаров\n• 📈 Аналитика\n• 🧾 Детальные чеки\n\n' + (f'📅 Период: {period_label}\n' if period_label else '') + 'Отчет сформирован автоматически.'
+        resp = telegram_client.call_api(
+            bot_token, 'sendDocument',
+            {'chat_id': user_id, 'caption': caption},
+            files={'document': (file_name, buffer, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')},
+            timeout=30
+        )
+        
+        print(f"📩 Ответ Telegram API: {resp.status_code}")
+        
+        if resp.status_code == 200:
+            print("✅ Excel файл успешно отправлен")
+            return {'success': True, 'message': 'Отчет отправлен в Telegram', 'report': sent_document(resp, file_name, caption)}
+        else:
+            error_text = resp.text[:200] if resp.text else 'Неизвестная ошибка'
+            print(f"❌ Ошибка Telegram API: {resp.status_code} - {error_text}")
+            return {'success': False, 'error': f'Ошибка отправки: {resp.status_code}'}
+    
+    except Exception as e:
+        print(f"💥 Ошибка при создании Excel: {e}")
+        import traceback
+        traceback.print_exc()
+        # Пробуем создать CSV как fallback
+        return export_to_csv(orders, bot_token, user_id, period_label, progress)
+
+def export_to_csv(orders, bot_token, user_id, period_label=None, progress=None):
+    """Резервный метод для создания CSV файла"""
+    try:
+        print("📊 Создаем CSV файл (резервный метод)...")
+        
+        # Строки кодируются в UTF-8 порциями по мере записи, без промежуточной строки со всем файлом
+        buffer = io.BytesIO()
+        output = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+        csv_writer = csv.writer(output)
+        
+        # Заголовки CSV
+        headers = ['ID', 'Дата и время', 'Клиент', 'Телефон', 'Сумма', 'Скидка', 'Итог', 
+                  'Способ', 'Адрес', 'Статус', 'Комментарий']
+        csv_writer.writerow(headers)
+        
+        status_names = {
+            1: 'Новый',
+            2: 'Подтвержден',
+            3: 'Собирается',
+            4: 'В пути',
+            5: 'Доставлен',
+            6: 'Отменен'
+        }
+        
+        for idx, order in enumerate(orders, 1):
+            if progress and idx % EXPORT_PROGRESS_STEP == 0:
+                progress('building', 30 + 50 * idx // len(orders))
+            
+            # Московское время — тот же разбор, что в OrderSummary
+            moscow_dt = to_moscow(order.get('created_at'))
+            order_time = moscow_dt.strftime('%d.%m.%Y %H:%M') if moscow_dt else (order.get('created_at') or '')
+            
+            row = [
+                order['id'],
+                order_time,
+                order['user_name'],
+                order['phone'],
+                order['total_amount'],
+                order.get('discount_amount', 0),
+                order['final_amount'],
+                'Доставка' if order['delivery_option'] == 'delivery' else 'Самовывоз',
+                order.get('delivery_address', ''),
+                status_names.get(order['status_id'], 'Новый'),
+                (order.get('comment', '')[:50] + '...') if len(order.get('comment', '')) > 50 else order.get('comment', '')
+            ]
+            csv_writer.writerow(row)
+        
+        output.flush()
+        output.detach()
+        buffer.seek(0)
+        print(f"✅ CSV создан: {buffer.getbuffer().nbytes} байт")
+        
+        print("📤 Отправляем CSV файл в Telegram...")
+        if progress:
+            progress('sending', 90)
+        file_name = 'orders_report.csv'
+        caption = '📊 Отчет по заказам в формате CSV' + (f'\n📅 Период: {period_label}' if period_label else '')
+        resp = telegram_client.call_api(
+            bot_token, 'sendDocument',
+            {'chat_id': user_id, 'caption': caption},
+            files={'document': (file_name, buffer, 'text/csv')},
+            timeout=30
+        )
+        
+        print(f"📩 Ответ Telegram API: {resp.status_code}")
+        
+        if resp.status_code == 200:
+            print("✅ CSV файл успешно отправлен в Telegram")
+            return {'success': True, 'message': 'CSV файл отправлен в Telegram', 'report': sent_document(resp, file_name, caption)}
+        else:
+            error_text = resp.text[:200] if resp.text else 'Неизвестная ошибка'
+            print(f"❌ Ошибка Telegram API: {resp.status_code} - {error_text}")
+            return {'success': False, 'error': f'Ошибка отправки файла: {resp.status_code}'}
+    
+    except Exception as e:
+        error_msg = str(e)
+        print(f"💥 Ошибка при создании CSV: {error_msg}")
+        return {'success': False, 'error': f'Ошибка создания файла: {error_msg}'}
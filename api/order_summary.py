@@ -0,0 +1,112 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+MOSCOW_TZ = timezone(timedelta(hours=3))
+
+def parse_items(items):
+    try:
+        if isinstance(items, str):
+            items = json.loads(items)
+        return items or []
+    except Exception:
+        return []
+
+def to_moscow(created_at):
+    """UTC-время из базы в московское; None, если разобрать не удалось"""
+    if not created_at:
+        return None
+    try:
+        created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        return created.astimezone(MOSCOW_TZ)
+    except Exception:
+        return None
+
+def moscow_date_to_utc(date_str, days=0):
+    """Начало московских суток (YYYY-MM-DD) в UTC, ISO-строкой"""
+    day = datetime.strptime(date_str, '%Y-%m-%d').replace(tzinfo=MOSCOW_TZ) + timedelta(days=days)
+    return day.astimezone(timezone.utc).isoformat()
+
+class OrderSummary:
+    """Сводки по заказам за один проход: add() разбирает заказ один раз и обновляет все итоги сразу.
+    Общий движок для Excel/CSV-экспорта и разбивки статистики в /api/admin/stats."""
+    
+    def __init__(self):
+        self.total_orders = 0
+        self.total_amount = 0
+        self.total_discount = 0
+        self.total_final = 0
+        self.total_products = 0
+        self.status_counts = {}
+        self.delivery_counts = {'delivery': 0, 'pickup': 0}
+        self.products = {}
+        self.days = {}
+    
+    def add(self, order):
+        """Учитывает заказ и возвращает разобранные данные для построчного вывода"""
+        items = parse_items(order.get('items'))
+        moscow_dt = to_moscow(order.get('created_at'))
+        final_amount = order.get('final_amount') or 0
+        
+        items_count = 0
+        for item in items:
+            name = item.get('name', 'Неизвестный товар')
+            quantity = item.get('quantity', 0)
+            product = self.products.setdefault(name, {'quantity': 0, 'revenue': 0})
+            product['quantity'] += quantity
+            product['revenue'] += item.get('total', 0)
+            items_count += quantity
+        
+        self.total_orders += 1
+        self.total_amount += order.get('total_amount') or 0
+        self.total_discount += order.get('discount_amount') or 0
+        self.total_final += final_amount
+        self.total_products += items_count
+        
+        status_id = order.get('status_id')
+        self.status_counts[status_id] = self.status_counts.get(status_id, 0) + 1
+        
+        delivery = 'delivery' if order.get('delivery_option') == 'delivery' else 'pickup'
+        self.delivery_counts[delivery] += 1
+        
+        if moscow_dt:
+            day = self.days.setdefault(moscow_dt.strftime('%Y-%m-%d'), {'orders': 0, 'final_amount': 0, 'products': 0})
+            day['orders'] += 1
+            day['final_amount'] += final_amount
+            day['products'] += items_count
+        
+        return {
+            'order': order,
+            'items': items,
+            'items_count': items_count,
+            'moscow_dt': moscow_dt,
+            'delivery': delivery
+        }
+    
+    def top_products(self, limit=None):
+        """[(название, количество, выручка)] по убыванию количества"""
+        ranked = sorted(self.products.items(), key=lambda product: product[1]['quantity'], reverse=True)
+        if limit:
+            ranked = ranked[:limit]
+        return [(name, stats['quantity'], stats['revenue']) for name, stats in ranked]
+    
+    def average_check(self):
+        return round(self.total_amount / self.total_orders, 2) if self.total_orders else 0
+    
+    def to_dict(self, top_limit=20):
+        return {
+            'total_orders': self.total_orders,
+            'total_amount': self.total_amount,
+            'total_discount': self.total_discount,
+            'total_final': self.total_final,
+            'total_products': self.total_products,
+            'average_check': self.average_check(),
+            'status_counts': {str(status_id): count for status_id, count in self.status_counts.items()},
+            'delivery_counts': self.delivery_counts,
+            'top_products': [
+                {'name': name, 'quantity': quantity, 'revenue': revenue}
+                for name, quantity, revenue in self.top_products(top_limit)
+            ],
+            'days': [dict(day=day, **stats) for day, stats in sorted(self.days.items())]
+        }
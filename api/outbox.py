@@ -0,0 +1,164 @@
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(__file__))
+
+try:
+    from supabase_client import supabase
+    from health import log_error
+    import telegram_client
+except ImportError as e:
+    print(f"Import error: {e}")
+
+MAX_ATTEMPTS = 8
+BASE_RETRY_DELAY = 30
+MAX_RETRY_DELAY = 6 * 60 * 60
+DRAIN_BATCH_SIZE = 50
+# Сколько просроченных строк добирает обычный запрос после своего ответа (drain_due)
+OPPORTUNISTIC_DRAIN_LIMIT = 10
+
+def make_message(chat_id, text, source=None, order_id=None, **params):
+    payload = {'chat_id': chat_id, 'text': text}
+    payload.update(params)
+    return {
+        'chat_id': str(chat_id),
+        'method': 'sendMessage',
+        'payload': payload,
+        'source': source,
+        'order_id': order_id
+    }
+
+def enqueue(messages):
+    if not messages:
+        return []
+    response = supabase.table("notification_outbox").insert(messages).execute()
+    return response.data or []
+
+def claim(limit=DRAIN_BATCH_SIZE, ids=None):
+    response = supabase.rpc("notification_outbox_claim", {'p_limit': limit, 'p_ids': ids}).execute()
+    return response.data or []
+
+def retry_delay(attempts):
+    delay = min(BASE_RETRY_DELAY * (2 ** (attempts - 1)), MAX_RETRY_DELAY)
+    return delay + random.uniform(0, delay / 4)
+
+def attempt_delivery(bot_token, row):
+    """Одна попытка отправки; возвращает (sent|retry|throttled|failed, ошибка, retry_after)"""
+    try:
+        response = telegram_client.call_api(bot_token, row.get('method') or 'sendMessage', row['payload'])
+    except Exception as e:
+        return 'retry', str(e), None
+    
+    if response.status_code == 200:
+        return 'sent', None, None
+    
+    try:
+        body = response.json()
+    except Exception:
+        body = {}
+    description = f"{response.status_code}: {body.get('description', response.text[:200])}"
+    
+    if response.status_code == 429:
+        retry_after = (body.get('parameters') or {}).get('retry_after', BASE_RETRY_DELAY)
+        return 'throttled', description, retry_after
+    if response.status_code >= 500:
+        return 'retry', description, None
+    # 400/403: чат не найден, бот заблокирован и т.п. — повтор не поможет
+    return 'failed', description, None
+
+def store_results(rows, results):
+    now = datetime.now(timezone.utc)
+    sent_ids = [row['id'] for row, (result, _, _) in zip(rows, results) if result == 'sent']
+    if sent_ids:
+        supabase.table("notification_outbox").update({
+            'status': 'sent',
+            'sent_at': now.isoformat(),
+            'last_error': None
+        }).in_("id", sent_ids).execute()
+    
+    for row, (result, error, retry_after) in zip(rows, results):
+        if result == 'sent':
+            continue
+        attempts = (row.get('attempts') or 0) + 1
+        update = {'attempts': attempts, 'last_error': error}
+        if result == 'failed' or attempts >= MAX_ATTEMPTS:
+            update['status'] = 'failed'
+        else:
+            delay = retry_after if result == 'throttled' else retry_delay(attempts)
+            update['next_attempt_at'] = (now + timedelta(seconds=delay)).isoformat()
+        supabase.table("notification_outbox").update(update).eq("id", row['id']).execute()
+
+def postpone(rows, seconds):
+    if not rows:
+        return
+    next_attempt_at = (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+    supabase.table("notification_outbox").update({
+        'next_attempt_at': next_attempt_at
+    }).in_("id", [row['id'] for row in rows]).execute()
+
+def deliver(bot_token, rows):
+    """Отправка заклейменных строк пачками; после 429 остаток пачки откладывается на retry_after"""
+    delivered = {}
+    chunk_size = telegram_client.MAX_PARALLEL_SENDS
+    
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        results = list(telegram_client.get_executor().map(lambda row: attempt_delivery(bot_token, row), chunk))
+        store_results(chunk, results)
+        delivered.update({row['id']: result == 'sent' for row, (result, _, _) in zip(chunk, results)})
+        
+        throttled = [retry_after for result, _, retry_after in results if result == 'throttled']
+        if throttled:
+            postpone(rows[start + chunk_size:], max(throttled))
+            break
+    
+    return delivered
+
+def deliver_now(bot_token, rows):
+    """Немедленная попытка доставить только что поставленные в очередь строки.
+    Недоставленные остаются в очереди для drain(). Возвращает список bool по строкам."""
+    if not rows:
+        return []
+    try:
+        delivered = deliver(bot_token, claim(len(rows), [row['id'] for row in rows]))
+    except Exception as e:
+        # Сообщения уже в очереди, их доставит drain()
+        log_error("outbox_deliver", e, "", f"Outbox IDs: {[row['id'] for row in rows]}")
+        delivered = {}
+    
+    return [delivered.get(row['id'], False) for row in rows]
+
+def send_direct(bot_token, messages):
+    """Без таблицы outbox: отправка напрямую, без повторов"""
+    results = telegram_client.get_executor().map(lambda message: attempt_delivery(bot_token, message)[0] == 'sent', messages)
+    return list(results)
+
+def send(bot_token, messages):
+    """Кладет сообщения в outbox и сразу пытается их доставить. Возвращает список bool по сообщениям."""
+    try:
+        rows = enqueue(messages)
+    except Exception as e:
+        # Без таблицы outbox отправляем напрямую, как раньше
+        log_error("outbox_enqueue", e, "", f"Messages: {len(messages)}")
+        return send_direct(bot_token, messages)
+    
+    return deliver_now(bot_token, rows)
+
+def drain(bot_token, limit=DRAIN_BATCH_SIZE):
+    rows = claim(limit)
+    delivered = deliver(bot_token, rows)
+    return {
+        'claimed': len(rows),
+        'sent': sum(1 for ok in delivered.values() if ok)
+    }
+
+def drain_due(bot_token, limit=OPPORTUNISTIC_DRAIN_LIMIT):
+    """Попутная доставка: небольшая пачка строк, срок повтора которых уже наступил.
+    Cron drain раз в сутки, поэтому без этого повторы с backoff ждали бы его; ошибки не пробрасываются"""
+    try:
+        return drain(bot_token, limit)
+    except Exception as e:
+        log_error("outbox_drain_due", e, "", f"Limit: {limit}")
+        return {'claimed': 0, 'sent': 0}
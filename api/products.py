@@ -1,194 +1,150 @@
-from http.server import BaseHTTPRequestHandler
 import json
 import os
 import sys
-from urllib.parse import urlparse, parse_qs
+import threading
+import time
 
 sys.path.append(os.path.dirname(__file__))
 
 try:
     from supabase_client import supabase
     from health import log_error
+    from http_cache import make_etag, send_cached_json
+    from routing import JsonHandler, HttpError, send_json
 except ImportError as e:
     print(f"Import error: {e}")
 
-class Handler(BaseHTTPRequestHandler):
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', '60'))
+
+_catalog_cache = {'all': None, 'available': None, 'responses': {}, 'loaded_at': 0.0}
+_catalog_lock = threading.Lock()
+
+def get_catalog(show_all=False):
+    with _catalog_lock:
+        if _catalog_cache['all'] is None or time.time() - _catalog_cache['loaded_at'] > CATALOG_CACHE_TTL:
+            response = supabase.table("products").select("*").order("sort_order").execute()
+            products = response.data or []
+            _catalog_cache['all'] = products
+            _catalog_cache['available'] = [p for p in products if p.get('is_available')]
+            _catalog_cache['responses'] = {}
+            _catalog_cache['loaded_at'] = time.time()
+        return _catalog_cache['all'] if show_all else _catalog_cache['available']
+
+def get_catalog_response(show_all=False):
+    products = get_catalog(show_all)
+    with _catalog_lock:
+        cached = _catalog_cache['responses'].get(show_all)
+        if cached is None or cached[0] is not products:
+            body = json.dumps(products).encode('utf-8')
+            cached = (products, body, make_etag(body))
+            _catalog_cache['responses'][show_all] = cached
+        return cached[1], cached[2]
+
+def apply_sort_order(table, order):
+    """Новый порядок {id: sort_order} одним запросом; в базе меняются только строки с другим sort_order.
+    Возвращает id измененных строк."""
+    if not order:
+        return []
+    response = supabase.rpc("reorder_rows", {
+        'p_table': table,
+        'p_order': {str(row_id): int(sort_order) for row_id, sort_order in order.items()}
+    }).execute()
+    return [row['id'] for row in response.data or []]
+
+def invalidate_catalog_cache():
+    with _catalog_lock:
+        _catalog_cache['all'] = None
+        _catalog_cache['available'] = None
+        _catalog_cache['responses'] = {}
+        _catalog_cache['loaded_at'] = 0.0
+
+FALLBACK_PRODUCTS = [
+    {
+        "id": 1,
+        "name": "Букет из 25 красных роз",
+        "price": 3500,
+        "image_url": "https://s.widget-club.com/images/YyiR86zpwIMIfrCZoSs4ulVD9RF3/1a4e33422efdd0fbf0c2af3394a67b13/ab18ec0a91069208210a71ac46ce9176.jpg",
+        "category": "roses",
+        "description": "Роскошные красные розы в элегантной упаковке",
+        "fact": "Красные розы символизируют глубокую любовь и страсть. В Древнем Риме они были символом Венеры - богини любви.",
+        "is_available": True,
+        "is_featured": True,
+        "sort_order": 1
+    }
+]
+
+class Handler(JsonHandler):
+    log_name = 'products'
+    routes = [
+        ('GET', '/api/products', 'get_products'),
+        ('POST', '/api/products', 'create_product'),
+        ('PUT', '/api/products', 'update_products'),
+        ('DELETE', '/api/products/{product_id}', 'delete_product'),
+    ]
     
-    def do_GET(self):
+    def get_products(self):
         try:
-            parsed_path = urlparse(self.path)
-            query_params = parse_qs(parsed_path.query)
-            show_all = query_params.get('show_all', ['false'])[0].lower() == 'true'
-            
-            if show_all:
-                response = supabase.table("products").select("*").order("sort_order").execute()
-            else:
-                response = supabase.table("products").select("*").eq("is_available", True).order("sort_order").execute()
-            
-            products = response.data
-
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            self.wfile.write(json.dumps(products).encode('utf-8'))
-            
+            show_all = self.query_param('show_all', 'false').lower() == 'true'
+            body, etag = get_catalog_response(show_all)
+            send_cached_json(self, body, etag)
         except Exception as e:
             log_error("products_GET", e, "", "Failed to fetch products")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            fallback_products = [
-                {
-                    "id": 1,
-                    "name": "Букет из 25 красных роз",
-                    "price": 3500,
-                    "image_url": "https://s.widget-club.com/images/YyiR86zpwIMIfrCZoSs4ulVD9RF3/1a4e33422efdd0fbf0c2af3394a67b13/ab18ec0a91069208210a71ac46ce9176.jpg",
-                    "category": "roses",
-                    "description": "Роскошные красные розы в элегантной упаковке",
-                    "fact": "Красные розы символизируют глубокую любовь и страсть. В Древнем Риме они были символом Венеры - богини любви.",
-                    "is_available": True,
-                    "is_featured": True,
-                    "sort_order": 1
-                }
-            ]
-            
-            self.wfile.write(json.dumps(fallback_products).encode('utf-8'))
+            send_json(self, FALLBACK_PRODUCTS, 500)
     
-    def do_POST(self):
-        try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            product_data = json.loads(post_data)
-            
-            required_fields = ['name', 'price']
-            for field in required_fields:
-                if field not in product_data or not product_data[field]:
-                    self.send_response(400)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    response = {'success': False, 'error': f'Missing required field: {field}'}
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
-                    return
-            
-            if 'category' not in product_data:
-                product_data['category'] = ''
-            
-            if 'is_available' not in product_data:
-                product_data['is_available'] = True
-            
-            if 'is_featured' not in product_data:
-                product_data['is_featured'] = False
-            
-            max_order_response = supabase.table("products").select("sort_order").order("sort_order", desc=True).limit(1).execute()
-            max_order = max_order_response.data[0]['sort_order'] if max_order_response.data else 0
-            product_data['sort_order'] = max_order + 1
-            
-            response = supabase.table("products").insert(product_data).execute()
-            
-            if not response.data:
-                raise Exception("No data returned from insert operation")
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            response_data = {'success': True, 'product': response.data[0]}
-            self.wfile.write(json.dumps(response_data).encode('utf-8'))
-            
-        except Exception as e:
-            log_error("products_POST", e, "", f"Product data: {product_data}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+    def create_product(self):
+        self.require_role()
+        product_data = self.json_body
+        
+        for field in ['name', 'price']:
+            if field not in product_data or not product_data[field]:
+                raise HttpError(400, f'Missing required field: {field}')
+        
+        if 'category' not in product_data:
+            product_data['category'] = ''
+        
+        if 'is_available' not in product_data:
+            product_data['is_available'] = True
+        
+        if 'is_featured' not in product_data:
+            product_data['is_featured'] = False
+        
+        max_order_response = supabase.table("products").select("sort_order").order("sort_order", desc=True).limit(1).execute()
+        max_order = max_order_response.data[0]['sort_order'] if max_order_response.data else 0
+        product_data['sort_order'] = max_order + 1
+        
+        response = supabase.table("products").insert(product_data).execute()
+        invalidate_catalog_cache()
+        
+        if not response.data:
+            raise Exception("No data returned from insert operation")
+        
+        return {'success': True, 'product': response.data[0]}
     
-    def do_PUT(self):
-        try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data)
-            
-            if 'reorder' in data:
-                products_order = data['reorder']
-                for product_id, sort_order in products_order.items():
-                    supabase.table("products").update({"sort_order": sort_order}).eq("id", int(product_id)).execute()
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                response_data = {'success': True}
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-            else:
-                product_data = data
-                product_id = product_data.get('id')
-                if not product_id:
-                    raise ValueError("Product ID is required")
-                
-                update_data = {k: v for k, v in product_data.items() if k != 'id'}
-                response = supabase.table("products").update(update_data).eq("id", product_id).execute()
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                
-                response_data = {'success': True, 'product': response.data[0] if response.data else None}
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-            
-        except Exception as e:
-            log_error("products_PUT", e, "", f"Update data: {data}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+    def update_products(self):
+        """PUT /api/products: {"reorder": {id: sort_order}} или товар с id"""
+        self.require_role()
+        data = self.json_body
+        
+        if 'reorder' in data:
+            changed = apply_sort_order("products", data['reorder'])
+            if changed:
+                invalidate_catalog_cache()
+            return {'success': True, 'changed': len(changed)}
+        
+        product_id = data.get('id')
+        if not product_id:
+            raise ValueError("Product ID is required")
+        
+        update_data = {k: v for k, v in data.items() if k != 'id'}
+        response = supabase.table("products").update(update_data).eq("id", product_id).execute()
+        invalidate_catalog_cache()
+        return {'success': True, 'product': response.data[0] if response.data else None}
     
-    def do_DELETE(self):
-        try:
-            path_parts = self.path.split('/')
-            product_id = path_parts[-1] if path_parts[-1] else path_parts[-2]
-            
-            if not product_id.isdigit():
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = {'success': False, 'error': 'Invalid product ID'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
-                return
-            
-            response = supabase.table("products").delete().eq("id", int(product_id)).execute()
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            response_data = {'success': True}
-            self.wfile.write(json.dumps(response_data).encode('utf-8'))
-            
-        except Exception as e:
-            log_error("products_DELETE", e, "", f"Product ID: {product_id}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+    def delete_product(self, product_id):
+        self.require_role()
+        if not product_id.isdigit():
+            raise HttpError(400, 'Invalid product ID')
+        
+        supabase.table("products").delete().eq("id", int(product_id)).execute()
+        invalidate_catalog_cache()
+        return {'success': True}
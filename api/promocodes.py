@@ -1,180 +1,147 @@
-from http.server import BaseHTTPRequestHandler
-import json
 import os
 import sys
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timezone
 
 sys.path.append(os.path.dirname(__file__))
 
 try:
     from supabase_client import supabase
     from health import log_error
+    from admin_roles import get_admin
+    from routing import JsonHandler, HttpError
 except ImportError as e:
     print(f"Import error: {e}")
 
-class Handler(BaseHTTPRequestHandler):
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-    
-    def do_GET(self):
-        try:
-            telegram_id = self.headers.get('Telegram-Id', '')
-            
-            admin_response = supabase.table("admins").select("role").eq("telegram_id", telegram_id).eq("is_active", True).execute()
-            is_owner = admin_response.data and admin_response.data[0].get('role') == 'owner'
-            
-            if not is_owner:
-                self.send_response(403)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = {'success': False, 'error': 'Access denied'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
-                return
-            
-            response = supabase.table("promocodes").select("*").order("created_at", desc=True).execute()
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(response.data).encode('utf-8'))
-            
-        except Exception as e:
-            log_error("promocodes_GET", e, self.headers.get('Telegram-Id', ''), "Failed to fetch promocodes")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+PROMOCODE_INDEX_TTL = int(os.environ.get('PROMOCODE_INDEX_TTL', '60'))
+
+_promocode_index = {'codes': None, 'loaded_at': 0.0}
+_promocode_lock = threading.Lock()
+
+PROMOCODE_ERRORS = {
+    'not_found': 'Промокод не найден',
+    'expired': 'Промокод просрочен',
+    'exhausted': 'Лимит использований промокода исчерпан'
+}
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+def get_promocode_index():
+    """Активные промокоды по нормализованному коду; обновляется раз в PROMOCODE_INDEX_TTL секунд"""
+    with _promocode_lock:
+        if _promocode_index['codes'] is None or time.time() - _promocode_index['loaded_at'] > PROMOCODE_INDEX_TTL:
+            response = supabase.table("promocodes").select("*").eq("is_active", True).execute()
+            _promocode_index['codes'] = {normalize_code(p['code']): p for p in response.data or []}
+            _promocode_index['loaded_at'] = time.time()
+        return _promocode_index['codes']
+
+def invalidate_promocode_index():
+    with _promocode_lock:
+        _promocode_index['codes'] = None
+        _promocode_index['loaded_at'] = 0.0
+
+def parse_timestamp(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def check_promocode(code, order_amount):
+    """Проверка по индексу в памяти, те же правила, что в promocode_redeem.
+    used_count может отставать на TTL — окончательно лимит проверяется при оформлении заказа."""
+    promocode = get_promocode_index().get(normalize_code(code))
+    if not promocode:
+        return {'status': 'not_found', 'promocode': None}
+    if promocode.get('valid_until') and parse_timestamp(promocode['valid_until']) < datetime.now(timezone.utc):
+        return {'status': 'expired', 'promocode': promocode}
+    if promocode.get('max_uses') and (promocode.get('used_count') or 0) >= promocode['max_uses']:
+        return {'status': 'exhausted', 'promocode': promocode}
+    if (promocode.get('min_order_amount') or 0) > order_amount:
+        return {'status': 'min_amount', 'promocode': promocode}
+    return {'status': 'ok', 'promocode': promocode}
+
+def redeem_promocode(code=None, promocode_id=None, order_amount=0, commit=True):
+    """Проверка промокода и (при commit) списание использования одним атомарным вызовом.
+    Возвращает {'status': 'ok' | 'not_found' | 'expired' | 'exhausted' | 'min_amount', 'promocode': ...}"""
+    response = supabase.rpc("promocode_redeem", {
+        'p_code': code,
+        'p_id': promocode_id,
+        'p_order_amount': order_amount,
+        'p_commit': commit
+    }).execute()
+    return response.data[0]
+
+def release_promocode(promocode_id):
+    try:
+        supabase.rpc("promocode_release", {'p_id': promocode_id}).execute()
+    except Exception as e:
+        log_error("promocode_release", e, "", f"Promocode ID: {promocode_id}")
+
+def promocode_error(result):
+    if result['status'] == 'min_amount':
+        return f'Минимальная сумма заказа для промокода: {result["promocode"]["min_order_amount"]}₽'
+    return PROMOCODE_ERRORS.get(result['status'], 'Промокод недействителен')
+
+def calculate_discount(promocode, order_amount):
+    if promocode['discount_type'] == 'percentage':
+        return int(order_amount * promocode['discount_value'] / 100)
+    return promocode['discount_value']
+
+class Handler(JsonHandler):
+    log_name = 'promocodes'
+    routes = [
+        ('GET', '/api/promocodes', 'list_promocodes'),
+        ('POST', '/api/promocodes', 'create_or_validate'),
+        ('DELETE', '/api/promocodes/{promocode_id}', 'delete_promocode'),
+    ]
     
-    def do_POST(self):
-        try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data)
-            
-            if data.get('action') == 'validate':
-                code = data.get('code')
-                order_amount = data.get('order_amount', 0)
-                
-                promocode_response = supabase.table("promocodes").select("*").eq("code", code).eq("is_active", True).execute()
-                
-                if not promocode_response.data:
-                    response_data = {'valid': False, 'error': 'Промокод не найден'}
-                else:
-                    promocode = promocode_response.data[0]
-                    now = datetime.now().isoformat()
-                    
-                    if promocode.get('valid_until') and promocode['valid_until'] < now:
-                        response_data = {'valid': False, 'error': 'Промокод просрочен'}
-                    elif promocode.get('max_uses') and promocode.get('used_count', 0) >= promocode['max_uses']:
-                        response_data = {'valid': False, 'error': 'Лимит использований промокода исчерпан'}
-                    elif promocode.get('min_order_amount', 0) > order_amount:
-                        response_data = {'valid': False, 'error': f'Минимальная сумма заказа для промокода: {promocode["min_order_amount"]}₽'}
-                    else:
-                        discount_amount = 0
-                        if promocode['discount_type'] == 'percentage':
-                            discount_amount = int(order_amount * promocode['discount_value'] / 100)
-                        else:
-                            discount_amount = promocode['discount_value']
-                        
-                        response_data = {
-                            'valid': True,
-                            'discount_amount': discount_amount,
-                            'promocode_id': promocode['id'],
-                            'discount_type': promocode['discount_type'],
-                            'discount_value': promocode['discount_value']
-                        }
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-                
-            else:
-                telegram_id = self.headers.get('Telegram-Id', '')
-                
-                admin_response = supabase.table("admins").select("role,id").eq("telegram_id", telegram_id).eq("is_active", True).execute()
-                is_owner = admin_response.data and admin_response.data[0].get('role') == 'owner'
-                
-                if not is_owner:
-                    self.send_response(403)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    response = {'success': False, 'error': 'Только владельцы могут создавать промокоды'}
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
-                    return
-                
-                promocode_data = {
-                    'code': data['code'],
-                    'discount_type': data['discount_type'],
-                    'discount_value': data['discount_value'],
-                    'min_order_amount': data.get('min_order_amount', 0),
-                    'max_uses': data.get('max_uses'),
-                    'valid_from': data.get('valid_from'),
-                    'valid_until': data.get('valid_until'),
-                    'created_by': admin_response.data[0]['id']
-                }
-                
-                response = supabase.table("promocodes").insert(promocode_data).execute()
-                
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response_data = {'success': True, 'promocode': response.data[0] if response.data else None}
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
-                
-        except Exception as e:
-            log_error("promocodes_POST", e, self.headers.get('Telegram-Id', ''), f"Action: {data.get('action')}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+    def list_promocodes(self):
+        self.require_role('owner')
+        return supabase.table("promocodes").select("*").order("created_at", desc=True).execute().data
     
-    def do_DELETE(self):
-        try:
-            telegram_id = self.headers.get('Telegram-Id', '')
-            
-            admin_response = supabase.table("admins").select("role").eq("telegram_id", telegram_id).eq("is_active", True).execute()
-            is_owner = admin_response.data and admin_response.data[0].get('role') == 'owner'
-            
-            if not is_owner:
-                self.send_response(403)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                response = {'success': False, 'error': 'Access denied'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
-                return
+    def create_or_validate(self):
+        data = self.json_body
+        
+        if data.get('action') == 'validate':
+            order_amount = data.get('order_amount', 0)
             
-            path_parts = self.path.split('/')
-            promocode_id = path_parts[-1] if path_parts[-1] else path_parts[-2]
+            # Без запроса к базе: использование списывается атомарно при оформлении заказа
+            result = check_promocode(data.get('code'), order_amount)
             
-            response = supabase.table("promocodes").delete().eq("id", promocode_id).execute()
+            if result['status'] != 'ok':
+                return {'valid': False, 'error': promocode_error(result)}
             
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response_data = {'success': True}
-            self.wfile.write(json.dumps(response_data).encode('utf-8'))
-            
-        except Exception as e:
-            log_error("promocodes_DELETE", e, self.headers.get('Telegram-Id', ''), f"Promocode ID: {promocode_id}")
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            promocode = result['promocode']
+            return {
+                'valid': True,
+                'discount_amount': calculate_discount(promocode, order_amount),
+                'promocode_id': promocode['id'],
+                'discount_type': promocode['discount_type'],
+                'discount_value': promocode['discount_value']
+            }
+        
+        # Роль — из сессии, запись администратора нужна только для created_by
+        admin = get_admin(self.require_role('owner')['sub'])
+        if not admin:
+            raise HttpError(403, 'Только владельцы могут создавать промокоды')
+        
+        promocode_data = {
+            'code': data['code'],
+            'discount_type': data['discount_type'],
+            'discount_value': data['discount_value'],
+            'min_order_amount': data.get('min_order_amount', 0),
+            'max_uses': data.get('max_uses'),
+            'valid_from': data.get('valid_from'),
+            'valid_until': data.get('valid_until'),
+            'created_by': admin['id']
+        }
+        
+        response = supabase.table("promocodes").insert(promocode_data).execute()
+        invalidate_promocode_index()
+        return {'success': True, 'promocode': response.data[0] if response.data else None}
+    
+    def delete_promocode(self, promocode_id):
+        self.require_role('owner')
+        supabase.table("promocodes").delete().eq("id", promocode_id).execute()
+        invalidate_promocode_index()
+        return {'success': True}
@@ -0,0 +1,168 @@
+from http.server import BaseHTTPRequestHandler
+import hmac
+import json
+import os
+import re
+import sys
+import time
+from urllib.parse import urlparse, parse_qs
+
+sys.path.append(os.path.dirname(__file__))
+
+try:
+    from health import log_error
+except ImportError as e:
+    print(f"Import error: {e}")
+
+ROUTE_PARAM = re.compile(r'\{(\w+)(?::(int))?\}')
+
+class HttpError(Exception):
+    """Ответ с ошибкой из обработчика маршрута: raise HttpError(400, 'Invalid category ID')"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def encode_json(data):
+    """Единственная точка сериализации ответов"""
+    return json.dumps(data).encode('utf-8')
+
+def read_json(handler):
+    """Тело запроса как JSON-объект; битое тело — ошибка клиента (400), а не сервера"""
+    length = int(handler.headers.get('Content-Length') or 0)
+    if not length:
+        return {}
+    try:
+        data = json.loads(handler.rfile.read(length))
+    except ValueError:
+        raise HttpError(400, 'Invalid JSON body')
+    if not isinstance(data, dict):
+        raise HttpError(400, 'Expected JSON object')
+    return data
+
+def send_json(handler, data, status=200, headers=None):
+    body = encode_json(data)
+    handler.send_response(status)
+    handler.send_header('Content-type', 'application/json')
+    handler.send_header('Content-Length', str(len(body)))
+    handler.send_header('Access-Control-Allow-Origin', '*')
+    started = getattr(handler, 'request_started', None)
+    if started is not None:
+        handler.send_header('Server-Timing', f'app;dur={(time.perf_counter() - started) * 1000:.1f}')
+    for name, value in (headers or {}).items():
+        handler.send_header(name, value)
+    handler.end_headers()
+    handler.wfile.write(body)
+
+def send_error(handler, status, message):
+    send_json(handler, {'success': False, 'error': message}, status)
+
+def compile_route(pattern):
+    """'/api/admin/category/{id:int}' → regex и преобразователи параметров; завершающий / необязателен"""
+    converters = {}
+    
+    def param(match):
+        name, kind = match.groups()
+        if kind == 'int':
+            converters[name] = int
+            return rf'(?P<{name}>\d+)'
+        return rf'(?P<{name}>[^/]+)'
+    
+    regex = ROUTE_PARAM.sub(param, re.escape(pattern).replace(r'\{', '{').replace(r'\}', '}'))
+    return re.compile(f'^{regex.rstrip("/")}/?$'), converters
+
+class JsonHandler(BaseHTTPRequestHandler):
+    """Базовый обработчик: маршруты компилируются один раз при объявлении класса.
+    routes = [(метод, шаблон пути, имя метода обработчика)]; обработчик возвращает данные для ответа 200
+    или None, если ответил сам (например, через ETag)."""
+    routes = []
+    allow_headers = 'Content-Type, If-None-Match, Session-Token'
+    log_name = 'api'
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compiled_routes = [(method, *compile_route(pattern), name) for method, pattern, name in cls.routes]
+        cls.allow_methods = ', '.join(sorted({method for method, _, _ in cls.routes} | {'OPTIONS'}))
+    
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', self.allow_methods)
+        self.send_header('Access-Control-Allow-Headers', self.allow_headers)
+        self.end_headers()
+    
+    def do_GET(self):
+        self.dispatch('GET')
+    
+    def do_POST(self):
+        self.dispatch('POST')
+    
+    def do_PUT(self):
+        self.dispatch('PUT')
+    
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+    
+    def dispatch(self, method):
+        self.request_started = time.perf_counter()
+        parsed = urlparse(self.path)
+        self.query = parse_qs(parsed.query)
+        self._json_body = None
+        
+        for route_method, regex, converters, name in self.compiled_routes:
+            if route_method != method:
+                continue
+            match = regex.match(parsed.path)
+            if not match:
+                continue
+            
+            params = {key: converters.get(key, str)(value) for key, value in match.groupdict().items()}
+            try:
+                data = getattr(self, name)(**params)
+                if data is not None:
+                    send_json(self, data)
+            except HttpError as e:
+                send_error(self, e.status, e.message)
+            except Exception as e:
+                log_error(f"{self.log_name}_{method}", e, self.headers.get('Telegram-Id', ''), f"Path: {self.path}")
+                send_error(self, 500, str(e))
+            return
+        
+        send_error(self, 404, 'Not found')
+    
+    @property
+    def json_body(self):
+        """Тело запроса читается и разбирается один раз"""
+        if self._json_body is None:
+            self._json_body = read_json(self)
+        return self._json_body
+    
+    def query_param(self, name, default=''):
+        return self.query.get(name, [default])[0]
+    
+    def is_cron_request(self):
+        """Вызов сервер-сервер (Vercel Cron, бот, health): Authorization: Bearer CRON_SECRET.
+        Без заданного CRON_SECRET таких вызовов нет"""
+        cron_secret = os.environ.get('CRON_SECRET')
+        if not cron_secret:
+            return False
+        return hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {cron_secret}")
+    
+    def require_session(self):
+        """Проверенная сессия запроса; без нее или с истекшей — 401, после которого клиент
+        обновляет сессию и повторяет запрос"""
+        # auth сам построен на JsonHandler, поэтому импортируется при вызове
+        from auth import get_session
+        session = get_session(self)
+        if not session:
+            raise HttpError(401, 'Требуется авторизация')
+        return session
+    
+    def require_role(self, *roles):
+        """Сессия администратора: require_role() — любая роль, require_role('owner') — только владелец.
+        Действующая сессия без нужной роли — 403"""
+        session = self.require_session()
+        role = session.get('role')
+        if role is None or (roles and role not in roles):
+            raise HttpError(403, 'Access denied')
+        return session
@@ -0,0 +1,59 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+try:
+    from supabase_client import supabase
+except ImportError as e:
+    print(f"Import error: {e}")
+
+SETTINGS_CACHE_TTL = int(os.environ.get('SETTINGS_CACHE_TTL', '30'))
+DEFAULT_DELIVERY_PRICE = 200
+DEFAULT_FREE_DELIVERY_MIN = 3000
+
+_settings_cache = {'settings': None, 'loaded_at': 0.0}
+_settings_lock = threading.Lock()
+
+def get_settings():
+    """Все shop_settings одним запросом как {key: value}; снимок живет SETTINGS_CACHE_TTL секунд"""
+    with _settings_lock:
+        if _settings_cache['settings'] is None or time.time() - _settings_cache['loaded_at'] > SETTINGS_CACHE_TTL:
+            response = supabase.table("shop_settings").select("key,value").execute()
+            _settings_cache['settings'] = {item['key']: item['value'] for item in response.data or []}
+            _settings_cache['loaded_at'] = time.time()
+        return _settings_cache['settings']
+
+def get_setting(key, default=None):
+    return get_settings().get(key, default)
+
+def get_setting_value(key, default=None):
+    """Для настроек вида {"value": ...}"""
+    setting = get_setting(key)
+    if isinstance(setting, dict):
+        return setting.get('value', default)
+    return default
+
+def get_delivery_cost(cart_total, delivery_option):
+    """Стоимость доставки и порог бесплатной доставки; без настройки delivery_price доставка бесплатна"""
+    free_delivery_min = DEFAULT_FREE_DELIVERY_MIN
+    if delivery_option != "delivery" or get_setting("delivery_price") is None:
+        return 0, free_delivery_min
+    
+    delivery_price = get_setting_value("delivery_price", DEFAULT_DELIVERY_PRICE)
+    free_delivery_min = get_setting_value("free_delivery_min", DEFAULT_FREE_DELIVERY_MIN)
+    return (0 if cart_total >= free_delivery_min else delivery_price), free_delivery_min
+
+def save_settings(values):
+    """Записывает {key: value} одним upsert по ключу и сбрасывает снимок"""
+    rows = [{'key': key, 'value': value} for key, value in values.items()]
+    response = supabase.table("shop_settings").upsert(rows, on_conflict='key').execute()
+    invalidate_settings_cache()
+    return response.data
+
+def invalidate_settings_cache():
+    with _settings_lock:
+        _settings_cache['settings'] = None
+        _settings_cache['loaded_at'] = 0.0
@@ -0,0 +1,85 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(__file__))
+
+try:
+    from supabase_client import supabase
+    from health import log_error
+except ImportError as e:
+    print(f"Import error: {e}")
+
+COMPLETED_STATUS_ID = 5
+MOSCOW_TZ = timezone(timedelta(hours=3))
+
+def order_day(order):
+    """Московская дата создания заказа (YYYY-MM-DD) — ключ дневной корзины"""
+    created_at = order.get('created_at')
+    if not created_at:
+        return None
+    try:
+        created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        return created.astimezone(MOSCOW_TZ).strftime('%Y-%m-%d')
+    except Exception:
+        return None
+
+def apply_delta(day, orders=0, completed=0, revenue=0, potential=0):
+    try:
+        supabase.rpc("shop_stats_apply", {
+            'p_day': day,
+            'p_orders': orders,
+            'p_completed': completed,
+            'p_revenue': revenue,
+            'p_potential': potential
+        }).execute()
+        return True
+    except Exception as e:
+        # Счетчики чинятся через shop_stats_rebuild, заказ из-за них не теряем
+        log_error("shop_stats_apply", e, "", f"Day: {day}, orders: {orders}, completed: {completed}")
+        return False
+
+def record_order_created(order):
+    if order.get('status_id') == COMPLETED_STATUS_ID:
+        return apply_delta(order_day(order), orders=1, completed=1, revenue=order.get('profit') or 0)
+    return apply_delta(order_day(order), orders=1, potential=order.get('total_amount') or 0)
+
+def record_status_change(order, new_status_id, new_profit=None):
+    """order — строка заказа до обновления (status_id, total_amount, profit, created_at)"""
+    old_status_id = order.get('status_id')
+    total_amount = order.get('total_amount') or 0
+    
+    if old_status_id != COMPLETED_STATUS_ID and new_status_id == COMPLETED_STATUS_ID:
+        profit = new_profit if new_profit is not None else (order.get('profit') or 0)
+        return apply_delta(order_day(order), completed=1, revenue=profit, potential=-total_amount)
+    if old_status_id == COMPLETED_STATUS_ID and new_status_id != COMPLETED_STATUS_ID:
+        return apply_delta(order_day(order), completed=-1, revenue=-(order.get('profit') or 0), potential=total_amount)
+    return True
+
+def record_order_deleted(order):
+    if order.get('status_id') == COMPLETED_STATUS_ID:
+        return apply_delta(order_day(order), orders=-1, completed=-1, revenue=-(order.get('profit') or 0))
+    return apply_delta(order_day(order), orders=-1, potential=-(order.get('total_amount') or 0))
+
+def rebuild():
+    supabase.rpc("shop_stats_rebuild", {}).execute()
+
+def read_stats():
+    response = supabase.table("shop_stats").select("*").eq("bucket", "total").execute()
+    totals = response.data[0] if response.data else {}
+    products = supabase.table("products").select("id", count="exact").limit(1).execute()
+    promocodes = supabase.table("promocodes").select("id", count="exact").eq("is_active", True).limit(1).execute()
+    
+    return {
+        'total_orders': totals.get('total_orders', 0),
+        'completed_orders': totals.get('completed_orders', 0),
+        'total_revenue': totals.get('total_revenue', 0),
+        'potential_revenue': totals.get('potential_revenue', 0),
+        'total_products': products.count or 0,
+        'active_promocodes': promocodes.count or 0
+    }
+
+def read_daily(days):
+    since = (datetime.now(MOSCOW_TZ) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    response = supabase.table("shop_stats").select("*").neq("bucket", "total").gte("bucket", since).order("bucket").execute()
+    return response.data
@@ -0,0 +1,35 @@
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+MAX_PARALLEL_SENDS = 8
+
+_session = None
+_executor = None
+_lock = threading.Lock()
+
+def get_session():
+    """Общая keep-alive сессия: TLS-рукопожатие с api.telegram.org один раз на инстанс"""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_PARALLEL_SENDS))
+            _session = session
+        return _session
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_SENDS, thread_name_prefix='telegram')
+        return _executor
+
+def call_api(bot_token, method, payload, timeout=10, files=None):
+    """POST в Bot API; с files — multipart (sendDocument), поля payload уходят формой"""
+    url = f"{TELEGRAM_API_URL}/bot{bot_token}/{method}"
+    if files:
+        return get_session().post(url, data=payload, files=files, timeout=timeout)
+    return get_session().post(url, json=payload, timeout=timeout)
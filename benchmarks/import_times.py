@@ -0,0 +1,124 @@
+"""Холодный импорт каждого api/*.py в отдельном интерпретаторе: время и память.
+
+    python benchmarks/import_times.py [--runs 7] [--save bench.json] [--compare bench.json]
+    python benchmarks/import_times.py --output bench_output.txt
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+
+from report import compare_results, emit, format_table, save_results
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api')
+
+# Импорт модуля в чистом интерпретаторе; при trace — еще и пик Python-кучи через tracemalloc
+# (он сам замедляет импорт, поэтому время берется только из прогонов без trace)
+PROBE = '''
+import json, resource, sys, time
+trace = sys.argv[2] == '1'
+if trace:
+    import tracemalloc
+    tracemalloc.start()
+before = set(sys.modules)
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - started
+result = {
+    'ms': elapsed * 1000,
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'rss_delta_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+    'modules': len(set(sys.modules) - before),
+    'openpyxl': 'openpyxl' in sys.modules
+}
+if trace:
+    result['heap_peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+print('BENCH ' + json.dumps(result))
+'''
+
+def probe_env():
+    """Модули требуют переменные окружения при импорте; соединений при импорте нет"""
+    env = dict(os.environ)
+    env.setdefault('SUPABASE_URL', 'http://127.0.0.1:54321')
+    env.setdefault('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.c2ln')
+    env.setdefault('BOT_TOKEN', '1:benchmark')
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+def run_probe(module, trace, env):
+    completed = subprocess.run(
+        [sys.executable, '-c', PROBE, module, '1' if trace else '0'],
+        cwd=API_DIR, env=env, capture_output=True, text=True
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith('BENCH '):
+            return json.loads(line[6:])
+    raise RuntimeError(((completed.stderr or completed.stdout).strip().splitlines() or ['no output'])[-1])
+
+def measure(module, runs, env):
+    samples = [run_probe(module, False, env) for _ in range(runs)]
+    traced = run_probe(module, True, env)
+    times = [sample['ms'] for sample in samples]
+    return {
+        'min_ms': min(times),
+        'median_ms': statistics.median(times),
+        'rss_mb': statistics.median(sample['rss_kb'] for sample in samples) / 1024,
+        'rss_delta_mb': statistics.median(sample['rss_delta_kb'] for sample in samples) / 1024,
+        'heap_peak_mb': traced['heap_peak_kb'] / 1024,
+        'modules': samples[0]['modules'],
+        'openpyxl': samples[0]['openpyxl']
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time and memory of every serverless entry point')
+    parser.add_argument('--runs', type=int, default=7, help='fresh interpreters per module')
+    parser.add_argument('--only', nargs='*', help='module names, default: every api/*.py')
+    parser.add_argument('--output', help='append the report to this file as well')
+    parser.add_argument('--save', help='store results in this JSON file (section "imports")')
+    parser.add_argument('--compare', help='compare median_ms with a saved JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown reported as regression')
+    args = parser.parse_args()
+    
+    modules = args.only or sorted(name[:-3] for name in os.listdir(API_DIR) if name.endswith('.py'))
+    env = probe_env()
+    results = {}
+    rows = []
+    
+    for module in modules:
+        try:
+            result = measure(module, args.runs, env)
+        except Exception as e:
+            rows.append([module, 'error', '', '', '', '', '', str(e)[:60]])
+            continue
+        results[module] = result
+        rows.append([
+            module,
+            f"{result['min_ms']:.1f}",
+            f"{result['median_ms']:.1f}",
+            f"{result['rss_mb']:.1f}",
+            f"{result['rss_delta_mb']:.1f}",
+            f"{result['heap_peak_mb']:.1f}",
+            result['modules'],
+            'openpyxl' if result['openpyxl'] else ''
+        ])
+    
+    emit(f"📦 Import time, {args.runs} fresh interpreters per module ({sys.version.split()[0]})", args.output)
+    emit(format_table(['module', 'min ms', 'median ms', 'rss MB', 'import rss MB', 'heap peak MB', 'modules', 'heavy'], rows), args.output)
+    
+    if args.save:
+        save_results(args.save, 'imports', results)
+    if args.compare:
+        table, regressions = compare_results(args.compare, 'imports', results, 'median_ms', args.threshold)
+        emit('\n📊 Compared with baseline', args.output)
+        emit(table, args.output)
+        if regressions:
+            emit(f"⚠️ Slower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}", args.output)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Прогон типичных запросов через Handler каждого модуля против локальной замены Supabase.
+Замеряется полное время обработки запроса (включая работу после ответа, как у заказа) и число
+обращений к базе и Telegram на один запрос. Сетевые вызовы Telegram уходят на тот же локальный сервер.
+
+    python benchmarks/replay.py [--requests 200] [--orders 2000] [--save bench.json] [--compare bench.json]
+    python benchmarks/replay.py --output bench_output.txt
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(__file__))
+
+from report import compare_results, emit, format_table, percentile, save_results
+from supabase_stand_in import Store, seed, start_stand_in
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api')
+
+OWNER_ID = '1000'
+CUSTOMER_ID = '2001'
+
+# Тело заказа в том виде, в каком его собирает submitOrder в index.html
+CHECKOUT = {
+    'user': {'id': int(CUSTOMER_ID), 'first_name': 'Клиент', 'username': 'customer'},
+    'phone': '+7 (999) 000-11-22',
+    'items': [
+        {'id': 1, 'name': 'Букет №1', 'price': 3500, 'quantity': 1, 'total': 3500},
+        {'id': 2, 'name': 'Букет №2', 'price': 2000, 'quantity': 2, 'total': 4000}
+    ],
+    'total': 6750,
+    'delivery_option': 'delivery',
+    'delivery_address': 'ул. Цветочная, 1',
+    'comment': 'Позвонить за час',
+    'promocode_id': 1,
+    'discount_amount': 750,
+    'time': '18.10.2026, 12:00:00'
+}
+
+# (модуль, метод, путь, тело, чья сессия) — то, что делают витрина и админка
+SCENARIOS = [
+    ('products', 'GET', '/api/products', None, None),
+    ('products', 'GET', '/api/products?show_all=true', None, 'owner'),
+    ('products', 'PUT', '/api/products', {'reorder': {'1': 2, '2': 1}}, 'owner'),
+    ('bootstrap', 'GET', '/api/bootstrap', None, None),
+    ('admin', 'GET', '/api/admin', None, 'owner'),
+    ('admin', 'GET', '/api/admin/stats', None, 'owner'),
+    ('admin', 'GET', '/api/admin/stats?days=30&breakdown=1', None, 'owner'),
+    ('admin', 'GET', '/api/admin/categories', None, 'owner'),
+    ('admin', 'GET', '/api/admin/settings', None, 'owner'),
+    ('admin', 'PUT', '/api/admin/categories/reorder', {'reorder': {'1': 2, '2': 1}}, 'owner'),
+    ('order', 'GET', '/api/order', None, 'customer'),
+    ('order', 'GET', '/api/order?limit=50', None, 'owner'),
+    ('order', 'GET', '/api/order?limit=50&status=1,2&delivery=delivery', None, 'owner'),
+    ('order', 'POST', '/api/order', CHECKOUT, 'customer'),
+    ('order', 'PUT', '/api/order', {'order_id': 10, 'status_id': 3}, 'owner'),
+    ('order', 'GET', '/api/order/export?from=2026-01-01', None, 'owner'),
+    ('promocodes', 'POST', '/api/promocodes', {'action': 'validate', 'code': 'spring', 'order_amount': 5000}, 'customer'),
+    ('themes', 'GET', '/api/themes', None, None),
+]
+
+def replayer(handler_cls):
+    """Handler без сокета: запрос читается из памяти, ответ пишется в BytesIO"""
+    class Replay(handler_cls):
+        def setup(self):
+            self.rfile = io.BytesIO(self.request)
+            self.wfile = io.BytesIO()
+        
+        def finish(self):
+            pass
+        
+        def log_message(self, format, *args):
+            pass
+    
+    return Replay
+
+def build_request(method, path, body, headers):
+    raw = json.dumps(body).encode('utf-8') if body is not None else b''
+    lines = [f'{method} {path} HTTP/1.1', 'Host: localhost', f'Content-Length: {len(raw)}']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + raw
+
+def send(replay_cls, request):
+    started = time.perf_counter()
+    handler = replay_cls(request, ('127.0.0.1', 0), None)
+    elapsed = (time.perf_counter() - started) * 1000
+    status_line = handler.wfile.getvalue().split(b'\r\n', 1)[0].decode('latin-1')
+    return elapsed, int(status_line.split()[1]) if status_line else 0
+
+def load_handlers(base_url, errors):
+    """Импорт модулей после того, как SUPABASE_URL указывает на локальный сервер"""
+    os.environ['SUPABASE_URL'] = base_url
+    os.environ.setdefault('SUPABASE_KEY', 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.c2ln')
+    os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+    os.environ.pop('CRON_SECRET', None)
+    sys.path.insert(0, API_DIR)
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        handlers = {module: replayer(__import__(module).Handler) for module in sorted({s[0] for s in SCENARIOS})}
+        import telegram_client
+    telegram_client.TELEGRAM_API_URL = base_url
+    
+    # log_error отправляет ошибки на боевой /api/health — в бенчмарке только считаем их
+    def count_error(module, error, user_id='unknown', additional_info=''):
+        errors.append(f'{module}: {error}')
+    
+    for module in list(sys.modules.values()):
+        if (getattr(module, '__file__', '') or '').startswith(API_DIR) and hasattr(module, 'log_error'):
+            module.log_error = count_error
+    return handlers
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay representative API requests against a local Supabase stand-in')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario after the first one')
+    parser.add_argument('--orders', type=int, default=2000, help='orders seeded into the stand-in')
+    parser.add_argument('--products', type=int, default=60, help='products seeded into the stand-in')
+    parser.add_argument('--only', nargs='*', help='modules to replay, default: all scenarios')
+    parser.add_argument('--output', help='append the report to this file as well')
+    parser.add_argument('--save', help='store results in this JSON file (section "replay")')
+    parser.add_argument('--compare', help='compare p50 with a saved JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown reported as regression')
+    args = parser.parse_args()
+    
+    store = seed(Store(), orders=args.orders, products=args.products)
+    server, base_url = start_stand_in(store)
+    errors = []
+    handlers = load_handlers(base_url, errors)
+    
+    from auth import issue_session_token
+    sessions = {
+        'owner': issue_session_token(OWNER_ID, 'owner')[0],
+        'customer': issue_session_token(CUSTOMER_ID, None)[0]
+    }
+    
+    results = {}
+    rows = []
+    for module, method, path, body, session in SCENARIOS:
+        if args.only and module not in args.only:
+            continue
+        label = f'{method} {path}'
+        request = build_request(method, path, body, {'Session-Token': sessions[session]} if session else {})
+        errors_before = len(errors)
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Первый запрос отдельно: в нем прогрев кэшей модуля и соединения с базой
+            first_ms, _ = send(handlers[module], request)
+            db_before = store.requests
+            samples = [send(handlers[module], request) for _ in range(args.requests)]
+        
+        timings = [elapsed for elapsed, _ in samples]
+        failed = sum(1 for _, status in samples if status >= 400)
+        results[label] = {
+            'first_ms': first_ms,
+            'p50_ms': percentile(timings, 0.50),
+            'p90_ms': percentile(timings, 0.90),
+            'p99_ms': percentile(timings, 0.99),
+            'max_ms': max(timings),
+            'backend_calls': (store.requests - db_before) / len(samples),
+            'failed': failed,
+            'logged_errors': len(errors) - errors_before
+        }
+        result = results[label]
+        rows.append([
+            label,
+            f"{result['first_ms']:.1f}",
+            f"{result['p50_ms']:.2f}",
+            f"{result['p90_ms']:.2f}",
+            f"{result['p99_ms']:.2f}",
+            f"{result['max_ms']:.2f}",
+            f"{result['backend_calls']:.1f}",
+            f"{failed}/{len(samples)}" if failed or result['logged_errors'] else ''
+        ])
+    
+    server.shutdown()
+    
+    emit(f"⏱️ Replay: {args.requests} requests per endpoint, {args.orders} orders, {args.products} products; "
+         f"backend calls = requests to the Supabase and Telegram stand-in per API request", args.output)
+    emit(format_table(['endpoint', 'first ms', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'backend calls', 'failed'], rows), args.output)
+    for error in sorted(set(errors))[:10]:
+        emit(f"❌ {error}", args.output)
+    
+    if args.save:
+        save_results(args.save, 'replay', results)
+    if args.compare:
+        table, regressions = compare_results(args.compare, 'replay', results, 'p50_ms', args.threshold)
+        emit('\n📊 Compared with baseline', args.output)
+        emit(table, args.output)
+        if regressions:
+            emit(f"⚠️ Slower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}", args.output)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import json
+import math
+import os
+
+def percentile(values, q):
+    """Перцентиль по ближайшему рангу: p50, p90, p99 из отсортированного списка замеров"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))]
+
+def format_table(headers, rows):
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    lines = ['  '.join(str(cell).ljust(width) for cell, width in zip(headers, widths))]
+    lines.append('  '.join('-' * width for width in widths))
+    lines += ['  '.join(str(cell).ljust(width) for cell, width in zip(row, widths)) for row in rows]
+    return '\n'.join(lines)
+
+def emit(text, output=None):
+    print(text)
+    if output:
+        with open(output, 'a', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+def save_results(path, section, results):
+    """Результаты разных скриптов лежат в одном JSON по разделам: imports, replay"""
+    data = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    data[section] = results
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+def compare_results(path, section, results, metric, threshold, min_delta=0.5):
+    """Сравнение с сохраненным baseline; возвращает строки отчета и список регрессий.
+    Регрессия — рост больше threshold и больше min_delta мс: шум доли миллисекунды не в счет."""
+    with open(path, encoding='utf-8') as f:
+        baseline = json.load(f).get(section, {})
+    
+    rows = []
+    regressions = []
+    for name, current in sorted(results.items()):
+        before = (baseline.get(name) or {}).get(metric)
+        after = current.get(metric)
+        if before is None or after is None:
+            rows.append([name, '—' if before is None else f'{before:.2f}', '—' if after is None else f'{after:.2f}', 'new'])
+            continue
+        change = (after - before) / before if before else 0.0
+        flag = '⚠️' if change > threshold and after - before > min_delta else ''
+        if flag:
+            regressions.append(name)
+        rows.append([name, f'{before:.2f}', f'{after:.2f}', f'{change * 100:+.0f}% {flag}'.strip()])
+    
+    return format_table(['name', f'baseline {metric}', f'current {metric}', 'change'], rows), regressions
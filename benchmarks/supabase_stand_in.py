@@ -0,0 +1,427 @@
+"""Локальная замена Supabase для бенчмарков: PostgREST-подобный HTTP-сервер в памяти
+и заглушка Telegram Bot API на том же порту. Данные генерируются детерминированно."""
+import copy
+import itertools
+import json
+import random
+import re
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+RESERVED_PARAMS = ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns')
+FILTER_ITEM = re.compile(r'^([\w]+)\.(not\.)?(eq|neq|gt|gte|lt|lte|in|is|like|ilike)\.(.*)$', re.S)
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def split_top_level(text):
+    """Разбивает 'a,b(c,d),"e,f"' по запятым верхнего уровня"""
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+def coerce(value, sample):
+    """Значение фильтра из строки запроса к типу значения в строке таблицы"""
+    value = value.strip('"')
+    if isinstance(sample, bool):
+        # postgrest-py передает True как "True"; Postgres принимает любой регистр
+        return value.lower() == 'true'
+    if isinstance(sample, (int, float)):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+def compare(row_value, op, raw):
+    if op == 'is':
+        return {'null': row_value is None, 'true': row_value is True, 'false': row_value is False}.get(raw.lower(), False)
+    if op == 'in':
+        values = [v.strip('"') for v in split_top_level(raw.strip('()'))]
+        return row_value is not None and str(row_value) in values
+    if row_value is None:
+        return False
+    value = coerce(raw, row_value)
+    if op in ('like', 'ilike'):
+        pattern = '^' + re.escape(raw).replace(r'\*', '.*').replace('%', '.*') + '$'
+        return re.match(pattern, str(row_value), re.I if op == 'ilike' else 0) is not None
+    if isinstance(value, str) and not isinstance(row_value, str):
+        row_value = str(row_value)
+    try:
+        return {
+            'eq': row_value == value,
+            'neq': row_value != value,
+            'gt': row_value > value,
+            'gte': row_value >= value,
+            'lt': row_value < value,
+            'lte': row_value <= value,
+        }[op]
+    except TypeError:
+        return False
+
+def parse_condition(item):
+    """'status_id.eq.5', 'and(a.eq.1,b.lt.2)' → функция от строки"""
+    for group in ('and', 'or'):
+        if item.startswith(f'{group}(') and item.endswith(')'):
+            conditions = [parse_condition(part) for part in split_top_level(item[len(group) + 1:-1])]
+            combine = all if group == 'and' else any
+            return lambda row, conditions=conditions, combine=combine: combine(c(row) for c in conditions)
+    
+    match = FILTER_ITEM.match(item)
+    if not match:
+        raise ValueError(f'Unsupported filter: {item}')
+    column, negate, op, raw = match.groups()
+    return lambda row: compare(row.get(column), op, raw) != bool(negate)
+
+def parse_filter(column, expression):
+    if column in ('or', 'and'):
+        return parse_condition(f'{column}{expression}')
+    return parse_condition(f'{column}.{expression}')
+
+def sort_rows(rows, order):
+    for part in reversed([p for p in order.split(',') if p]):
+        pieces = part.split('.')
+        column = pieces[0]
+        desc = 'desc' in pieces[1:]
+        nulls_first = 'nullsfirst' in pieces[1:] or ('nullslast' not in pieces[1:] and desc)
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: r[column], reverse=desc)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+def project(rows, select):
+    columns = [c.strip() for c in split_top_level(select or '*') if c.strip()]
+    if not columns or '*' in columns:
+        return rows
+    # Вложенные ресурсы (products(name)) в коде не используются, берем только простые колонки
+    columns = [c for c in columns if '(' not in c]
+    return [{c: row.get(c) for c in columns} for row in rows]
+
+class Store:
+    """Таблицы в памяти и RPC-функции из supabase/migrations в упрощенном виде"""
+    
+    TABLE_DEFAULTS = {
+        'orders': {'status_id': 1, 'profit': 0, 'side_effects': None},
+        'notification_outbox': {'status': 'pending', 'attempts': 0, 'last_error': None, 'next_attempt_at': None, 'sent_at': None},
+        'export_jobs': {'status': 'queued', 'progress': 0},
+    }
+    
+    def __init__(self):
+        self.tables = {}
+        self.ids = itertools.count(100000)
+        self.lock = threading.Lock()
+        self.requests = 0
+    
+    def rows(self, table):
+        return self.tables.setdefault(table, [])
+    
+    def select(self, table, filters, order='', select='*', start=0, end=None):
+        rows = [row for row in self.rows(table) if all(f(row) for f in filters)]
+        if order:
+            rows = sort_rows(rows, order)
+        total = len(rows)
+        rows = rows[start:] if end is None else rows[start:end + 1]
+        return project(copy.deepcopy(rows), select), total
+    
+    def insert(self, table, payload, upsert_on=None):
+        rows = self.rows(table)
+        result = []
+        for item in payload if isinstance(payload, list) else [payload]:
+            item = copy.deepcopy(item)
+            if upsert_on:
+                keys = upsert_on.split(',')
+                existing = [r for r in rows if all(str(r.get(k)) == str(item.get(k)) for k in keys)]
+                if existing:
+                    existing[0].update(item)
+                    result.append(copy.deepcopy(existing[0]))
+                    continue
+            record = dict(self.TABLE_DEFAULTS.get(table, {}))
+            record.update(item)
+            record.setdefault('id', next(self.ids))
+            record.setdefault('created_at', now_iso())
+            rows.append(record)
+            result.append(copy.deepcopy(record))
+        return result
+    
+    def update(self, table, filters, values):
+        matched = [row for row in self.rows(table) if all(f(row) for f in filters)]
+        for row in matched:
+            row.update(copy.deepcopy(values))
+        return copy.deepcopy(matched)
+    
+    def delete(self, table, filters):
+        matched, kept = [], []
+        for row in self.rows(table):
+            (matched if all(f(row) for f in filters) else kept).append(row)
+        self.tables[table] = kept
+        return copy.deepcopy(matched)
+    
+    def rpc(self, name, params):
+        function = getattr(self, f'rpc_{name}', None)
+        if function is None:
+            raise NotImplementedError(name)
+        return function(**params)
+    
+    def rpc_shop_stats_summary(self):
+        orders = self.rows('orders')
+        completed = [o for o in orders if o.get('status_id') == 5]
+        return [{
+            'total_orders': len(orders),
+            'completed_orders': len(completed),
+            'total_revenue': sum(o.get('profit') or 0 for o in completed),
+            'potential_revenue': sum(o.get('total_amount') or 0 for o in orders if o.get('status_id') != 5),
+            'total_products': len(self.rows('products')),
+            'active_promocodes': len([p for p in self.rows('promocodes') if p.get('is_active')])
+        }]
+    
+    def rpc_shop_stats_apply(self, p_day, p_orders=0, p_completed=0, p_revenue=0, p_potential=0):
+        stats = self.rows('shop_stats')
+        for bucket in ('total', p_day):
+            row = next((r for r in stats if r['bucket'] == bucket), None)
+            if row is None:
+                row = {'id': next(self.ids), 'bucket': bucket, 'total_orders': 0, 'completed_orders': 0, 'total_revenue': 0, 'potential_revenue': 0}
+                stats.append(row)
+            row['total_orders'] += p_orders
+            row['completed_orders'] += p_completed
+            row['total_revenue'] += p_revenue
+            row['potential_revenue'] += p_potential
+        return None
+    
+    def rpc_promocode_redeem(self, p_code=None, p_id=None, p_order_amount=0, p_commit=True):
+        promocode = next((p for p in self.rows('promocodes') if p.get('is_active') and (
+            p['id'] == p_id if p_id is not None else p['code'].upper() == (p_code or '').strip().upper()
+        )), None)
+        if not promocode:
+            return [{'status': 'not_found', 'promocode': None}]
+        if promocode.get('max_uses') and promocode.get('used_count', 0) >= promocode['max_uses']:
+            return [{'status': 'exhausted', 'promocode': promocode}]
+        if (promocode.get('min_order_amount') or 0) > p_order_amount:
+            return [{'status': 'min_amount', 'promocode': promocode}]
+        if p_commit:
+            promocode['used_count'] = promocode.get('used_count', 0) + 1
+        return [{'status': 'ok', 'promocode': copy.deepcopy(promocode)}]
+    
+    def rpc_promocode_release(self, p_id):
+        for promocode in self.rows('promocodes'):
+            if promocode['id'] == p_id and promocode.get('used_count'):
+                promocode['used_count'] -= 1
+        return None
+    
+    def rpc_notification_outbox_claim(self, p_limit=50, p_ids=None, p_lease_seconds=120):
+        # Как в миграции: строка остается pending, аренда — сдвиг next_attempt_at вперед
+        now = datetime.now(timezone.utc)
+        lease_until = (now + timedelta(seconds=p_lease_seconds)).isoformat()
+        claimed = []
+        for row in self.rows('notification_outbox'):
+            if len(claimed) >= p_limit:
+                break
+            due = row.get('next_attempt_at') is None or datetime.fromisoformat(row['next_attempt_at']) <= now
+            if row['status'] == 'pending' and due and (p_ids is None or row['id'] in p_ids):
+                row['next_attempt_at'] = lease_until
+                row['attempts'] = row.get('attempts') or 0
+                claimed.append(copy.deepcopy(row))
+        return claimed
+    
+    def rpc_export_job_claim(self, p_id=None, p_stale_seconds=900):
+        # Зависшие running-задачи стенд не перезапускает: бенчмарк их не создает
+        for job in sorted(self.rows('export_jobs'), key=lambda row: row.get('created_at') or ''):
+            if job['status'] == 'queued' and (p_id is None or job['id'] == p_id):
+                job.update(status='running', stage='queued', started_at=now_iso(), updated_at=now_iso())
+                return [copy.deepcopy(job)]
+        return []
+    
+    def rpc_reorder_rows(self, p_table, p_order):
+        changed = []
+        for row in self.rows(p_table):
+            new_order = p_order.get(str(row['id']))
+            if new_order is not None and row.get('sort_order') != int(new_order):
+                row['sort_order'] = int(new_order)
+                changed.append({'id': row['id']})
+        return changed
+    
+    def rpc_orders_watermark(self):
+        orders = self.rows('orders')
+        return [{
+            'max_id': max((o['id'] for o in orders), default=0),
+            'max_updated_at': max((o.get('updated_at') or o['created_at'] for o in orders), default=None),
+            'row_count': len(orders)
+        }]
+
+def seed(store, orders=2000, products=60, seed_value=42):
+    """Каталог, настройки, администраторы и история заказов за 90 дней"""
+    rnd = random.Random(seed_value)
+    categories = ['roses', 'tulips', 'peonies', 'mono', 'author', 'gifts']
+    store.tables['categories'] = [
+        {'id': i, 'name': name.title(), 'slug': name, 'icon': 'fas fa-folder', 'sort_order': i, 'is_active': True}
+        for i, name in enumerate(categories, 1)
+    ]
+    store.tables['products'] = [
+        {
+            'id': i, 'name': f'Букет №{i}', 'price': rnd.randrange(1500, 9000, 100),
+            'image_url': f'https://example.invalid/{i}.jpg', 'category': rnd.choice(categories),
+            'description': 'Описание букета ' * 4, 'fact': 'Интересный факт о цветах ' * 3,
+            'is_available': i % 7 != 0, 'is_featured': i % 5 == 0, 'sort_order': i
+        }
+        for i in range(1, products + 1)
+    ]
+    store.tables['shop_settings'] = [
+        {'id': 1, 'key': 'delivery_price', 'value': {'value': 300}},
+        {'id': 2, 'key': 'free_delivery_min', 'value': {'value': 5000}},
+        {'id': 3, 'key': 'contacts', 'value': {'phone': '+7 900 000-00-00', 'address': 'ул. Цветочная, 1'}},
+        {'id': 4, 'key': 'active_theme', 'value': {'value': '1'}},
+        {'id': 5, 'key': 'shop_name', 'value': {'value': 'АРТФЛОРА'}},
+    ]
+    store.tables['shop_themes'] = [
+        {'id': i, 'name': f'Тема {i}', 'background_value': '#ffffff', 'is_active': i == 1} for i in range(1, 4)
+    ]
+    store.tables['order_statuses'] = [
+        {'id': i, 'name': name, 'color': color}
+        for i, (name, color) in enumerate([('Новый', '#FF6B6B'), ('Подтвержден', '#FFA726'), ('Собирается', '#8E44AD'),
+                                           ('В пути', '#3498DB'), ('Доставлен', '#27AE60'), ('Отменен', '#95A5A6')], 1)
+    ]
+    store.tables['admins'] = [
+        {'id': 1, 'telegram_id': '1000', 'role': 'owner', 'is_active': True, 'first_name': 'Owner', 'username': 'owner'},
+        {'id': 2, 'telegram_id': '1001', 'role': 'manager', 'is_active': True, 'first_name': 'Manager', 'username': 'manager'},
+    ]
+    store.tables['promocodes'] = [
+        {'id': 1, 'code': 'SPRING', 'discount_type': 'percentage', 'discount_value': 10, 'min_order_amount': 0,
+         'max_uses': None, 'used_count': 0, 'valid_until': None, 'is_active': True, 'created_at': now_iso()},
+        {'id': 2, 'code': 'MINUS500', 'discount_type': 'fixed', 'discount_value': 500, 'min_order_amount': 3000,
+         'max_uses': 1000000, 'used_count': 0, 'valid_until': None, 'is_active': True, 'created_at': now_iso()},
+    ]
+    store.tables['notification_outbox'] = []
+    store.tables['shop_stats'] = []
+    store.tables['orders'] = []
+    
+    started = datetime.now(timezone.utc) - timedelta(days=90)
+    catalog = store.tables['products']
+    for i in range(1, orders + 1):
+        picked = rnd.sample(catalog, rnd.randint(1, 4))
+        items = []
+        for product in picked:
+            quantity = rnd.randint(1, 3)
+            items.append({'id': product['id'], 'name': product['name'], 'price': product['price'], 'quantity': quantity, 'total': product['price'] * quantity})
+        total = sum(item['total'] for item in items)
+        status_id = rnd.randint(1, 6)
+        created_at = (started + timedelta(minutes=i * 90 * 24 * 60 // orders)).isoformat()
+        order = {
+            'id': i, 'user_id': str(2000 + i % 300), 'user_name': f'Клиент {i % 300}', 'user_username': '',
+            'phone': '79990001122', 'comment': '', 'delivery_option': rnd.choice(['delivery', 'pickup']),
+            'delivery_address': '', 'items': items, 'total_amount': total, 'discount_amount': 0,
+            'final_amount': total, 'promocode_id': None, 'status_id': status_id,
+            'profit': total if status_id == 5 else 0, 'created_at': created_at, 'updated_at': created_at,
+            'side_effects': {'status': 'done'}
+        }
+        store.tables['orders'].append(order)
+        store.rpc_shop_stats_apply(created_at[:10], p_orders=1, p_completed=int(status_id == 5),
+                                   p_revenue=order['profit'], p_potential=0 if status_id == 5 else total)
+    return store
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят одним пакетом, иначе keep-alive упирается в задержку ACK (~40 мс)
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    store = None
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def send_body(self, status, data, headers=None):
+        body = b'' if data is None else json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def handle_any(self, method):
+        parsed = urlparse(self.path)
+        store = self.store
+        with store.lock:
+            store.requests += 1
+        # Клиент пишет заголовки и тело отдельно, и тело ждет ACK: подтверждаем сразу (только Linux)
+        if hasattr(socket, 'TCP_QUICKACK'):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        # postgrest-py отправляет тело {} и с GET/DELETE — читаем всегда, чтобы не сбить keep-alive
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        
+        # Telegram Bot API: /bot<token>/<method>
+        if parsed.path.startswith('/bot'):
+            return self.send_body(200, {'ok': True, 'result': {'message_id': 1, 'document': {'file_id': 'stand-in-file'}}})
+        
+        if not parsed.path.startswith('/rest/v1/'):
+            return self.send_body(404, {'message': f'Unknown path {parsed.path}'})
+        
+        target = parsed.path[len('/rest/v1/'):]
+        params = parse_qsl(parsed.query, keep_blank_values=True)
+        try:
+            body = json.loads(raw) if raw else {}
+            with store.lock:
+                if target.startswith('rpc/'):
+                    result = store.rpc(target[4:], body or {})
+                    return self.send_body(200 if result is not None else 204, result)
+                
+                filters = [parse_filter(key, value) for key, value in params if key not in RESERVED_PARAMS]
+                options = dict((key, value) for key, value in params if key in RESERVED_PARAMS)
+                
+                if method == 'GET':
+                    start = int(options.get('offset', 0))
+                    end = start + int(options['limit']) - 1 if 'limit' in options else None
+                    range_header = self.headers.get('Range')
+                    if range_header:
+                        first, last = range_header.split('-')
+                        start, end = int(first), int(last)
+                    rows, total = store.select(target, filters, options.get('order', ''), options.get('select', '*'), start, end)
+                    headers = {'Content-Range': f'{start}-{start + len(rows) - 1}/{total}'}
+                    return self.send_body(200, rows, headers)
+                if method == 'POST':
+                    upsert = 'merge-duplicates' in (self.headers.get('Prefer') or '')
+                    return self.send_body(201, store.insert(target, body, options.get('on_conflict', 'id') if upsert else None))
+                if method == 'PATCH':
+                    return self.send_body(200, store.update(target, filters, body))
+                if method == 'DELETE':
+                    return self.send_body(200, store.delete(target, filters))
+        except NotImplementedError as e:
+            return self.send_body(404, {'message': f'Could not find the function public.{e}', 'code': 'PGRST202'})
+        except Exception as e:
+            return self.send_body(400, {'message': str(e), 'code': 'PGRST100'})
+    
+    def do_GET(self):
+        self.handle_any('GET')
+    
+    def do_POST(self):
+        self.handle_any('POST')
+    
+    def do_PATCH(self):
+        self.handle_any('PATCH')
+    
+    def do_DELETE(self):
+        self.handle_any('DELETE')
+
+def start_stand_in(store, host='127.0.0.1', port=0):
+    """Запускает сервер в фоновом потоке; возвращает (server, base_url)"""
+    handler = type('BoundStandInHandler', (StandInHandler,), {'store': store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
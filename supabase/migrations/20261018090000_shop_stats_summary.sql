@@ -0,0 +1,17 @@
+-- Aggregates for /api/admin/stats computed inside Postgres,
+-- so the API receives six numbers instead of every order row.
+-- Returned as a one-row set: postgrest-py expects RPC results to be a list.
+create or replace function public.shop_stats_summary()
+returns setof json
+language sql
+stable
+as $$
+  select json_build_object(
+    'total_orders', (select count(*) from orders),
+    'completed_orders', (select count(*) from orders where status_id = 5),
+    'total_revenue', (select coalesce(sum(profit), 0) from orders where status_id = 5),
+    'potential_revenue', (select coalesce(sum(total_amount), 0) from orders where status_id is distinct from 5),
+    'total_products', (select count(*) from products),
+    'active_promocodes', (select count(*) from promocodes where is_active)
+  );
+$$;
@@ -0,0 +1,79 @@
+-- Incrementally maintained order statistics.
+-- bucket = 'total' for shop-wide totals, or a Moscow calendar date 'YYYY-MM-DD'
+-- for the orders created on that day.
+create table if not exists public.shop_stats (
+  bucket text primary key,
+  total_orders integer not null default 0,
+  completed_orders integer not null default 0,
+  total_revenue numeric not null default 0,
+  potential_revenue numeric not null default 0,
+  updated_at timestamptz not null default now()
+);
+
+-- Adds a delta to the 'total' row and to the day bucket in one statement.
+create or replace function public.shop_stats_apply(
+  p_day text,
+  p_orders integer default 0,
+  p_completed integer default 0,
+  p_revenue numeric default 0,
+  p_potential numeric default 0
+)
+returns void
+language sql
+as $$
+  insert into shop_stats as s (bucket, total_orders, completed_orders, total_revenue, potential_revenue, updated_at)
+  select bucket, p_orders, p_completed, p_revenue, p_potential, now()
+  from (values ('total'), (p_day)) as b(bucket)
+  where bucket is not null
+  on conflict (bucket) do update set
+    total_orders = s.total_orders + excluded.total_orders,
+    completed_orders = s.completed_orders + excluded.completed_orders,
+    total_revenue = s.total_revenue + excluded.total_revenue,
+    potential_revenue = s.potential_revenue + excluded.potential_revenue,
+    updated_at = now();
+$$;
+
+-- Backfill / repair: recomputes every bucket from the orders table.
+create or replace function public.shop_stats_rebuild()
+returns void
+language plpgsql
+as $$
+begin
+  delete from shop_stats where true;
+
+  insert into shop_stats (bucket, total_orders, completed_orders, total_revenue, potential_revenue)
+  select
+    case when grouping(day) = 1 then 'total' else day end,
+    count(*),
+    count(*) filter (where status_id = 5),
+    coalesce(sum(profit) filter (where status_id = 5), 0),
+    coalesce(sum(total_amount) filter (where status_id is distinct from 5), 0)
+  from (
+    select to_char(created_at at time zone 'Europe/Moscow', 'YYYY-MM-DD') as day, status_id, profit, total_amount
+    from orders
+  ) o
+  group by grouping sets ((day), ())
+  having grouping(day) = 1 or day is not null;
+end;
+$$;
+
+-- /api/admin/stats now reads the rollup instead of aggregating orders.
+drop function if exists public.shop_stats_summary();
+create function public.shop_stats_summary()
+returns setof json
+language sql
+stable
+as $$
+  select json_build_object(
+    'total_orders', coalesce(s.total_orders, 0),
+    'completed_orders', coalesce(s.completed_orders, 0),
+    'total_revenue', coalesce(s.total_revenue, 0),
+    'potential_revenue', coalesce(s.potential_revenue, 0),
+    'total_products', (select count(*) from products),
+    'active_promocodes', (select count(*) from promocodes where is_active)
+  )
+  from (select 1) as one
+  left join shop_stats s on s.bucket = 'total';
+$$;
+
+select public.shop_stats_rebuild();
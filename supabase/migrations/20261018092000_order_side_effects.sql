@@ -0,0 +1,3 @@
+-- Outcome of the post-response checkout stage (notifications).
+-- Written as {"status": "pending"} on insert and replaced once the stage finishes.
+alter table public.orders add column if not exists side_effects jsonb;
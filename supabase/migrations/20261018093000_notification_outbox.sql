@@ -0,0 +1,43 @@
+-- Durable queue for outgoing Telegram messages.
+-- Rows are claimed with a short lease, so the cron drain and the
+-- in-request delivery attempt never send the same row twice.
+create table if not exists public.notification_outbox (
+  id bigserial primary key,
+  chat_id text not null,
+  method text not null default 'sendMessage',
+  payload jsonb not null,
+  source text,
+  order_id bigint,
+  status text not null default 'pending',
+  attempts integer not null default 0,
+  next_attempt_at timestamptz not null default now(),
+  last_error text,
+  created_at timestamptz not null default now(),
+  sent_at timestamptz
+);
+
+create index if not exists notification_outbox_pending_idx
+  on public.notification_outbox (next_attempt_at)
+  where status = 'pending';
+
+create or replace function public.notification_outbox_claim(
+  p_limit integer default 50,
+  p_ids bigint[] default null,
+  p_lease_seconds integer default 120
+)
+returns setof public.notification_outbox
+language sql
+as $$
+  update notification_outbox o
+  set next_attempt_at = now() + make_interval(secs => p_lease_seconds)
+  where o.id in (
+    select id from notification_outbox
+    where status = 'pending'
+      and next_attempt_at <= now()
+      and (p_ids is null or id = any(p_ids))
+    order by next_attempt_at
+    limit p_limit
+    for update skip locked
+  )
+  returning o.*;
+$$;
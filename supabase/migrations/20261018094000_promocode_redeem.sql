@@ -0,0 +1,73 @@
+-- Atomic promocode redemption.
+-- promocode_redeem() checks a code and, when p_commit is true, bumps used_count
+-- in the same conditional UPDATE, so concurrent checkouts can never exceed
+-- max_uses. With p_commit = false it only validates (the checkout "apply" button).
+-- Returns one row: {"status": "ok" | "not_found" | "expired" | "exhausted" | "min_amount",
+--                   "promocode": <row or null>}
+
+create or replace function public.promocode_redeem(
+    p_code text default null,
+    p_id bigint default null,
+    p_order_amount numeric default 0,
+    p_commit boolean default true
+)
+returns setof jsonb
+language plpgsql
+as $$
+declare
+    promo public.promocodes%rowtype;
+    status text;
+begin
+    if p_commit then
+        update public.promocodes
+           set used_count = coalesce(used_count, 0) + 1
+         where (id = p_id or (p_id is null and code = p_code))
+           and is_active
+           and (valid_until is null or valid_until >= now())
+           and (coalesce(max_uses, 0) = 0 or coalesce(used_count, 0) < max_uses)
+           and coalesce(min_order_amount, 0) <= p_order_amount
+        returning * into promo;
+
+        if found then
+            return next jsonb_build_object('status', 'ok', 'promocode', to_jsonb(promo));
+            return;
+        end if;
+    end if;
+
+    -- Check-only mode, or the UPDATE matched nothing: work out why
+    select * into promo
+      from public.promocodes
+     where (id = p_id or (p_id is null and code = p_code))
+       and is_active;
+
+    if not found then
+        return next jsonb_build_object('status', 'not_found', 'promocode', null);
+        return;
+    end if;
+
+    if promo.valid_until is not null and promo.valid_until < now() then
+        status := 'expired';
+    elsif coalesce(promo.max_uses, 0) > 0 and coalesce(promo.used_count, 0) >= promo.max_uses then
+        status := 'exhausted';
+    elsif coalesce(promo.min_order_amount, 0) > p_order_amount then
+        status := 'min_amount';
+    elsif p_commit then
+        -- The row changed between the UPDATE and this SELECT; treat it as used up
+        status := 'exhausted';
+    else
+        status := 'ok';
+    end if;
+
+    return next jsonb_build_object('status', status, 'promocode', to_jsonb(promo));
+end;
+$$;
+
+-- Gives a redemption back when the order it was taken for could not be saved.
+create or replace function public.promocode_release(p_id bigint)
+returns void
+language sql
+as $$
+    update public.promocodes
+       set used_count = used_count - 1
+     where id = p_id and used_count > 0;
+$$;
@@ -0,0 +1,8 @@
+-- Per-admin watermark for "since last export" reports.
+-- last_order_id is the highest orders.id delivered in that admin's last
+-- incremental export; the next one only reads orders with a larger id.
+create table if not exists public.export_watermarks (
+    telegram_id text primary key,
+    last_order_id bigint not null default 0,
+    exported_at timestamptz not null default now()
+);
@@ -0,0 +1,51 @@
+-- Background order exports.
+-- GET /api/order/export only inserts a queued job; the worker
+-- (/api/order/export/run, triggered right away and by cron) builds the file,
+-- sends it to Telegram and reports progress that the admin UI polls.
+create table if not exists public.export_jobs (
+  id bigserial primary key,
+  telegram_id text not null,
+  params jsonb not null default '{}'::jsonb,
+  status text not null default 'queued',
+  progress integer not null default 0,
+  stage text,
+  total_orders integer,
+  message text,
+  error text,
+  created_at timestamptz not null default now(),
+  updated_at timestamptz not null default now(),
+  started_at timestamptz,
+  finished_at timestamptz
+);
+
+create index if not exists export_jobs_queued_idx
+  on public.export_jobs (created_at)
+  where status = 'queued';
+
+-- Takes one queued job (a specific one, or the oldest) and marks it running,
+-- so the immediate trigger and the cron never build the same report twice.
+-- A job stuck in 'running' longer than p_stale_seconds (the function was
+-- killed mid-export) is picked up again.
+create or replace function public.export_job_claim(
+  p_id bigint default null,
+  p_stale_seconds integer default 900
+)
+returns setof public.export_jobs
+language sql
+as $$
+  update export_jobs j
+  set status = 'running',
+      stage = 'queued',
+      started_at = now(),
+      updated_at = now()
+  where j.id in (
+    select id from export_jobs
+    where (status = 'queued'
+           or (status = 'running' and updated_at < now() - make_interval(secs => p_stale_seconds)))
+      and (p_id is null or id = p_id)
+    order by created_at
+    limit 1
+    for update skip locked
+  )
+  returning j.*;
+$$;
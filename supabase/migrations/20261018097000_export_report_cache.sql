@@ -0,0 +1,49 @@
+-- Cache of delivered export reports.
+-- A report is identified by the state of the orders table (max id, max
+-- updated_at, row count — the count catches deletions) plus its parameters;
+-- while that key is unchanged the worker resends the Telegram file_id
+-- instead of rebuilding and uploading the file.
+alter table public.orders
+  add column if not exists updated_at timestamptz not null default now();
+
+create index if not exists orders_updated_at_idx on public.orders (updated_at);
+
+create or replace function public.orders_touch_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at = now();
+  return new;
+end;
+$$;
+
+drop trigger if exists orders_touch_updated_at on public.orders;
+create trigger orders_touch_updated_at
+  before update on public.orders
+  for each row execute function public.orders_touch_updated_at();
+
+-- One-row set: postgrest-py expects RPC results to be a list.
+create or replace function public.orders_watermark()
+returns setof json
+language sql
+stable
+as $$
+  select json_build_object(
+    'max_id', coalesce(max(id), 0),
+    'max_updated_at', max(updated_at),
+    'total', count(*)
+  )
+  from orders;
+$$;
+
+create table if not exists public.export_reports (
+  cache_key text primary key,
+  file_id text not null,
+  file_name text,
+  caption text,
+  message text,
+  total_orders integer,
+  last_order_id bigint,
+  created_at timestamptz not null default now()
+);
@@ -0,0 +1,24 @@
+-- Bulk reorder for the admin drag-and-drop lists.
+-- p_order maps row id -> new sort_order ({"12": 1, "7": 2, ...}); one UPDATE
+-- applies the whole map and skips rows whose sort_order is already right.
+-- Returns the ids that actually changed.
+create or replace function public.reorder_rows(p_table text, p_order jsonb)
+returns table (id bigint)
+language plpgsql
+as $$
+begin
+  if p_table not in ('products', 'categories') then
+    raise exception 'reorder is not allowed for table %', p_table;
+  end if;
+
+  return query execute format(
+    'update public.%I t
+        set sort_order = o.value::integer
+       from jsonb_each_text($1) o
+      where t.id = o.key::bigint
+        and t.sort_order is distinct from o.value::integer
+      returning t.id::bigint',
+    p_table
+  ) using p_order;
+end;
+$$;
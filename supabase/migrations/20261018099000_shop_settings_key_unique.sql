@@ -0,0 +1,10 @@
+-- shop_settings is written with upsert(on_conflict='key') — the bulk settings
+-- save and single-key updates — which needs a unique key. Older rows written
+-- by select-then-insert could duplicate a key; keep one row per key.
+delete from public.shop_settings s
+ using public.shop_settings newer
+ where s.key = newer.key
+   and s.ctid < newer.ctid;
+
+create unique index if not exists shop_settings_key_key
+  on public.shop_settings (key);